@@ -0,0 +1,120 @@
+import os
+import time
+from collections import OrderedDict
+from artificial_intelligence.detect_sponsors import generate_openai_response, generate_openai_response_stream
+from database.vector_index import normalize_rows
+
+# Configuración de la caché semántica de respuestas (desde .env)
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.97"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000"))
+
+class AnswerCache:
+    """Caché de respuestas por (embedding de la consulta, videos recuperados), con TTL e invalidación por canal.
+
+    Una respuesta se reutiliza si se recuperaron exactamente los mismos videos y la consulta es casi idéntica
+    (similitud de coseno >= ANSWER_CACHE_SIMILARITY).
+    """
+
+    def __init__(self, ttl=ANSWER_CACHE_TTL_SECONDS, similarity=ANSWER_CACHE_SIMILARITY,
+                 max_entries=ANSWER_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.similarity = similarity
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # id -> entrada
+        self._by_videos = {}  # frozenset(video_ids) -> ids de entradas
+        self._next_id = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        siblings = self._by_videos.get(entry["video_ids"])
+        if siblings is not None:
+            siblings.discard(entry_id)
+            if not siblings:
+                del self._by_videos[entry["video_ids"]]
+
+    def get(self, query_embedding, video_ids):
+        """Devuelve la respuesta guardada para una consulta equivalente, o None."""
+        key = frozenset(video_ids)
+        query = normalize_rows(query_embedding)[0]
+        now = time.monotonic()
+
+        for entry_id in list(self._by_videos.get(key, ())):
+            entry = self._entries[entry_id]
+            if entry["expires_at"] < now:
+                self._remove(entry_id)
+                continue
+            if float(entry["embedding"] @ query) >= self.similarity:
+                self._entries.move_to_end(entry_id)
+                self.hits += 1
+                return entry["answer"]
+
+        self.misses += 1
+        return None
+
+    def put(self, query_embedding, videos, answer):
+        """Guarda la respuesta generada para la consulta y los videos recuperados."""
+        entry_id = self._next_id
+        self._next_id += 1
+        key = frozenset(video["video_id"] for video in videos)
+        self._entries[entry_id] = {
+            "embedding": normalize_rows(query_embedding)[0],
+            "video_ids": key,
+            "channels": {video.get("channel_name") for video in videos},
+            "answer": answer,
+            "expires_at": time.monotonic() + self.ttl
+        }
+        self._by_videos.setdefault(key, set()).add(entry_id)
+
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate_channels(self, channel_names):
+        """Descarta las respuestas que citan videos de canales con contenido nuevo."""
+        channel_names = set(channel_names)
+        stale = [entry_id for entry_id, entry in self._entries.items() if entry["channels"] & channel_names]
+        for entry_id in stale:
+            self._remove(entry_id)
+        return len(stale)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "size": len(self._entries)
+        }
+
+_cache = AnswerCache()
+
+def get_answer_cache():
+    """Devuelve la caché de respuestas compartida."""
+    return _cache
+
+async def cached_openai_response(user_query, query_embedding, similar_videos):
+    """Genera la respuesta con OpenAI salvo que ya haya una equivalente en caché."""
+    cache = get_answer_cache()
+    answer = cache.get(query_embedding, [video["video_id"] for video in similar_videos])
+    if answer is None:
+        answer = await generate_openai_response(user_query, similar_videos)
+        cache.put(query_embedding, similar_videos, answer)
+    return answer
+
+async def cached_openai_response_stream(user_query, query_embedding, similar_videos):
+    """Versión en streaming: si hay respuesta en caché se emite de una vez; si no, se guarda al terminar."""
+    cache = get_answer_cache()
+    answer = cache.get(query_embedding, [video["video_id"] for video in similar_videos])
+    if answer is not None:
+        yield answer
+        return
+
+    chunks = []
+    async for chunk in generate_openai_response_stream(user_query, similar_videos):
+        chunks.append(chunk)
+        yield chunk
+    cache.put(query_embedding, similar_videos, "".join(chunks))
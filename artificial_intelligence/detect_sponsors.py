@@ -1,30 +1,106 @@
-import openai
 import json
+import logging
 import os
 from dotenv import load_dotenv
 import re
+import hashlib
+import asyncio
 import numpy as np
+from artificial_intelligence.embedding_cache import CACHE_DIR, cache_key, get_embedding_cache
+from artificial_intelligence.sponsor_cache import get_sponsor_cache, split_paragraphs, sponsor_cache_key
+from artificial_intelligence.sponsor_prefilter import SPONSOR_PREFILTER_ENABLED, is_likely_sponsored
+from database.vector_index import normalize_rows
+from monitoring.metrics import record_openai_response, record_openai_usage, track_call
+
+logger = logging.getLogger(__name__)
 
 # Cargar API Key de OpenAI desde .env
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-client = openai.OpenAI(api_key=OPENAI_API_KEY)
+
+# El cliente se crea en el primer uso: importar openai cuesta ~0.4 s y no hace falta para importar el módulo
+_client = None
+
+def get_openai_client():
+    """Devuelve el cliente asíncrono de OpenAI compartido, creándolo la primera vez."""
+    global _client
+    if _client is None:
+        import openai
+        if not OPENAI_API_KEY:
+            logger.error("❌ ERROR: La clave OPENAI_API_KEY no está configurada en .env")
+        _client = openai.AsyncOpenAI(api_key=OPENAI_API_KEY)
+    return _client
+
+def set_openai_client(openai_client):
+    """Reemplaza el cliente de OpenAI (p. ej. por uno simulado en benchmarks)."""
+    global _client
+    _client = openai_client
+
+# Limitador opcional de peticiones a OpenAI (p. ej. la parte del límite por minuto que toca a cada proceso)
+_rate_limiter = None
+
+def set_openai_rate_limiter(limiter):
+    """Activa (o desactiva con None) un limitador con método `acquire()` antes de cada llamada a OpenAI."""
+    global _rate_limiter
+    _rate_limiter = limiter
+
+async def _wait_for_rate_limit():
+    if _rate_limiter is not None:
+        await _rate_limiter.acquire()
 
 # Lista de palabras clave sobre patrocinadores y publicidad en YouTube
 KEYWORDS = ["sponsor", "patrocinador", "marca", "publicidad", "anuncio", 
             "empresa", "producto", "afiliado", "descuento", "colaboración", "brand"]
 
-# Verificar que la API Key está configurada
-if not OPENAI_API_KEY:
-    print("❌ ERROR: La clave OPENAI_API_KEY no está configurada en .env")
-else:
-    print(f"✅ OPENAI_API_KEY cargada correctamente: {OPENAI_API_KEY[:5]}*****")
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# Modelo y versión del prompt de extracción (forman parte de la clave de la caché de patrocinadores)
+SPONSOR_MODEL = "gpt-4o-mini-realtime-preview"
+SPONSOR_PROMPT_VERSION = "v1"  # Incrementar al cambiar el prompt para invalidar la caché
+
+# Modo por párrafos: solo se envían al LLM los párrafos que no están en caché
+SPONSOR_SEGMENT_MODE = os.getenv("SPONSOR_SEGMENT_MODE", "0") == "1"
+
+# Límites por petición de embeddings (la API admite hasta 2048 entradas y ~300k tokens)
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "2048"))
+EMBEDDING_BATCH_TOKENS = int(os.getenv("EMBEDDING_BATCH_TOKENS", "250000"))
+RELEVANCE_THRESHOLD = 0.4
+
+# Matriz normalizada (len(KEYWORDS) x dim) con los embeddings de las palabras clave
+_keyword_matrix = None
+_keyword_lock = asyncio.Lock()
+
+# Peticiones de embedding en curso, para que consultas simultáneas del mismo texto compartan la llamada
+_pending_embeddings = {}
+
+async def _create_chat_completion(model, prompt, **kwargs):
+    """Llamada de chat a OpenAI que registra latencia, tokens y coste en las métricas."""
+    await _wait_for_rate_limit()
+    async with track_call("openai", model):
+        response = await get_openai_client().chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            **kwargs
+        )
+    record_openai_response(model, response)
+    return response
+
+async def _create_embeddings(openai_client, texts, model):
+    """Llamada de embeddings a OpenAI que registra latencia, tokens y coste en las métricas."""
+    await _wait_for_rate_limit()
+    async with track_call("openai", model):
+        response = await openai_client.embeddings.create(input=texts, model=model)
+    record_openai_response(model, response)
+    return response
 
-def detect_sponsors_openai(description):
-    """Detecta marcas patrocinadoras en una descripción de video."""
+async def detect_sponsors_openai(description, raise_errors=False):
+    """Detecta marcas patrocinadoras en una descripción de video.
+
+    Con raise_errors=True los fallos se propagan en lugar de devolver [], para no cachearlos.
+    """
     
     if not description:
-        print("🔍 No description provided.")
+        logger.debug("🔍 No description provided.")
         return []
 
     prompt = f"""
@@ -48,13 +124,10 @@ def detect_sponsors_openai(description):
         """
 
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini-realtime-preview",
-            messages=[{"role": "user", "content": prompt}],
-        )
+        response = await _create_chat_completion(SPONSOR_MODEL, prompt)
 
         raw_output = response.choices[0].message.content.strip()
-        print(f"🔍 OpenAI Raw Output BEFORE JSON Parsing: {raw_output}")  # Depuración
+        logger.debug("🔍 OpenAI Raw Output BEFORE JSON Parsing: %s", raw_output)
 
         # Limpiar la salida de OpenAI si hay texto extra
         cleaned_output = re.sub(r'^\*\*Output:\*\*\s*', '', raw_output)
@@ -64,43 +137,221 @@ def detect_sponsors_openai(description):
             return detected_brands if isinstance(detected_brands, list) else []
         
         except json.JSONDecodeError:
-            print("❌ JSON Decode Error: OpenAI did not return a valid JSON array.")
+            logger.warning("❌ JSON Decode Error: OpenAI did not return a valid JSON array.")
+            if raise_errors:
+                raise
             return []
     
     except Exception as e:
-        print(f"❌ OpenAI API Error: {e}")
+        logger.error("❌ OpenAI API Error: %s", e)
+        if raise_errors:
+            raise
+        return []
+
+def _merge_brands(brand_lists):
+    """Une listas de marcas sin duplicados (sin distinguir mayúsculas), conservando el orden."""
+    seen = set()
+    merged = []
+    for brands in brand_lists:
+        for brand in brands:
+            if isinstance(brand, str) and brand.lower() not in seen:
+                seen.add(brand.lower())
+                merged.append(brand)
+    return merged
+
+async def _detect_segment(segment, slot=None):
+    """Llamada al LLM para un segmento; con slot (factoría de context managers async) se ejecuta dentro de él."""
+    if slot is None:
+        return await detect_sponsors_openai(segment, raise_errors=True)
+    async with slot():
+        return await detect_sponsors_openai(segment, raise_errors=True)
+
+def _sponsor_segments(description, segment_mode, prefilter):
+    """Textos de una descripción que se consultan al LLM: la descripción o sus párrafos, tras el prefiltro."""
+    if not description:
         return []
+    segments = split_paragraphs(description) if segment_mode else [description]
+    if prefilter:
+        segments = [segment for segment in segments if is_likely_sponsored(segment)]
+    return segments
+
+async def detect_sponsors_batch(descriptions, segment_mode=None, prefilter=None, slot=None):
+    """Detecta los patrocinadores de varias descripciones (p. ej. todos los videos nuevos de un escaneo).
+
+    La caché se consulta una sola vez para todos los segmentos y los resultados nuevos se guardan en una sola
+    escritura; los segmentos repetidos entre descripciones se envían al LLM una sola vez. Con el prefiltro
+    activo, los textos sin señales de patrocinio no se envían. slot acota cada llamada al LLM por separado
+    (p. ej. el semáforo de openai_chat del pipeline).
+
+    Devuelve, por descripción, la lista de marcas o la excepción de un segmento que falló: un resultado parcial
+    se guardaría como definitivo, así que ese video debe quedar como error y reintentarse.
+    """
+    segment_mode = SPONSOR_SEGMENT_MODE if segment_mode is None else segment_mode
+    prefilter = SPONSOR_PREFILTER_ENABLED if prefilter is None else prefilter
+    cache = get_sponsor_cache()
+    keyed = [
+        [(sponsor_cache_key(segment, SPONSOR_MODEL, SPONSOR_PROMPT_VERSION), segment)
+         for segment in _sponsor_segments(description, segment_mode, prefilter)]
+        for description in descriptions
+    ]
+    keys = list(dict.fromkeys(key for segments in keyed for key, _ in segments))
+    cached = await cache.get_many(keys) if keys else {}
+
+    # Enviar al LLM solo los segmentos no vistos (una vez cada uno)
+    unseen = {}
+    for segments in keyed:
+        for key, segment in segments:
+            if key not in cached:
+                unseen.setdefault(key, segment)
+
+    results = await asyncio.gather(*(_detect_segment(segment, slot) for segment in unseen.values()),
+                                   return_exceptions=True)
+    failures, extracted = {}, {}
+    for key, brands in zip(unseen, results):
+        if isinstance(brands, Exception):
+            failures[key] = brands  # No cachear fallos
+        else:
+            extracted[key] = brands
 
-def generate_openai_embedding(text):
-    """Genera un embedding con OpenAI"""
-    response = client.embeddings.create(
-    input=text,
-    model="text-embedding-3-small"
-    )
+    if extracted:
+        cached.update(extracted)
+        try:
+            await cache.set_many(extracted, model=SPONSOR_MODEL, prompt_version=SPONSOR_PROMPT_VERSION)
+        except Exception as e:
+            logger.error("❌ Error guardando %d extracciones en la caché de patrocinadores: %s", len(extracted), e)
+
+    output = []
+    for segments in keyed:
+        failure = next((failures[key] for key, _ in segments if key in failures), None)
+        output.append(failure if failure is not None else _merge_brands(cached.get(key, []) for key, _ in segments))
+    return output
+
+async def detect_sponsors_cached(description, segment_mode=None, prefilter=None, slot=None):
+    """Como detect_sponsors_batch para una sola descripción: devuelve sus marcas o relanza el fallo."""
+    result, = await detect_sponsors_batch([description], segment_mode, prefilter, slot)
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+async def _fetch_embedding(text, model):
+    response = await _create_embeddings(get_openai_client(), text, model)
     return response.data[0].embedding
 
-def is_relevant_question(user_query):
+async def generate_openai_embedding(text, model=EMBEDDING_MODEL):
+    """Genera un embedding con OpenAI, reutilizando la caché si el texto ya se calculó."""
+    cache = get_embedding_cache()
+    cached = cache.get(model, text)
+    if cached is not None:
+        return cached.tolist()
+
+    # Si el mismo texto ya se está calculando, esperar a esa misma petición
+    key = cache_key(model, text)
+    task = _pending_embeddings.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_fetch_embedding(text, model))
+        _pending_embeddings[key] = task
+        task.add_done_callback(lambda _: _pending_embeddings.pop(key, None))
+
+    embedding = await asyncio.shield(task)
+    cache.put(model, text, embedding)
+    return embedding
+
+def estimate_tokens(text):
+    """Estimación rápida de tokens (~4 caracteres por token) para repartir lotes sin tokenizador."""
+    return len(text) // 4 + 1
+
+def batch_texts(texts, max_batch_size=EMBEDDING_BATCH_SIZE, max_batch_tokens=EMBEDDING_BATCH_TOKENS):
+    """Agrupa textos en lotes que respetan el número máximo de entradas y el presupuesto de tokens."""
+    batch, batch_tokens = [], 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if batch and (len(batch) >= max_batch_size or batch_tokens + tokens > max_batch_tokens):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append(text)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+async def generate_openai_embeddings(texts, model=EMBEDDING_MODEL, openai_client=None,
+                                     max_batch_size=EMBEDDING_BATCH_SIZE, max_batch_tokens=EMBEDDING_BATCH_TOKENS):
+    """Genera embeddings para muchos textos con el mínimo de peticiones, devolviéndolos en el mismo orden."""
+    openai_client = openai_client or get_openai_client()
+    cache = get_embedding_cache()
+    texts = list(texts)
+    embeddings = [None] * len(texts)
+
+    # Resolver primero desde la caché y agrupar los textos repetidos
+    missing = {}
+    for position, text in enumerate(texts):
+        cached = cache.get(model, text)
+        if cached is not None:
+            embeddings[position] = cached.tolist()
+        else:
+            missing.setdefault(cache_key(model, text), []).append(position)
+
+    unique_texts = [texts[positions[0]] for positions in missing.values()]
+    for batch in batch_texts(unique_texts, max_batch_size, max_batch_tokens):
+        response = await _create_embeddings(openai_client, batch, model)
+        for item in response.data:
+            text = batch[item.index]
+            cache.put(model, text, item.embedding)
+            for position in missing[cache_key(model, text)]:
+                embeddings[position] = item.embedding
+
+    return embeddings
+
+def _keyword_cache_path(model=EMBEDDING_MODEL, keywords=KEYWORDS):
+    """Ruta del fichero de caché, identificada por modelo y lista de palabras clave."""
+    key = hashlib.sha256(f"{model}\n{json.dumps(keywords, ensure_ascii=False)}".encode("utf-8")).hexdigest()[:16]
+    return CACHE_DIR / f"keyword_embeddings_{key}.npy"
+
+async def get_keyword_embeddings():
+    """Devuelve la matriz normalizada de embeddings de KEYWORDS, calculándola una sola vez."""
+    global _keyword_matrix
+    if _keyword_matrix is not None:
+        return _keyword_matrix
+
+    async with _keyword_lock:
+        if _keyword_matrix is not None:
+            return _keyword_matrix
+
+        path = _keyword_cache_path()
+        if path.exists():
+            _keyword_matrix = np.load(path)
+            return _keyword_matrix
+
+        # Una única llamada con todas las palabras clave
+        _keyword_matrix = normalize_rows(await generate_openai_embeddings(KEYWORDS))
+
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            np.save(path, _keyword_matrix)
+        except OSError as e:
+            logger.warning("⚠️ No se pudo guardar la caché de palabras clave: %s", e)
+
+    return _keyword_matrix
+
+async def is_relevant_question(user_query):
     """Evalúa si una pregunta es relevante basándose en embeddings y palabras clave."""
 
-    # Obtener embedding de la pregunta del usuario
-    user_embedding = generate_openai_embedding(user_query)
+    # Obtener embedding de la pregunta del usuario y los de las palabras clave (precalculados)
+    user_embedding = normalize_rows(await generate_openai_embedding(user_query))[0]
+    keyword_matrix = await get_keyword_embeddings()
 
-    # Obtener embeddings de las palabras clave
-    keyword_embeddings = [generate_openai_embedding(keyword) for keyword in KEYWORDS]
+    # Similitud de coseno con todas las palabras clave en un único producto matriz-vector
+    similarities = keyword_matrix @ user_embedding
 
-    # Calcular la similitud de coseno entre la pregunta y cada palabra clave
-    similarities = [
-        np.dot(user_embedding, keyword_emb) / (np.linalg.norm(user_embedding) * np.linalg.norm(keyword_emb))
-        for keyword_emb in keyword_embeddings
-    ]
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("📊 Similitudes con palabras clave: %s", similarities.tolist())
 
-    print(f"📊 Similitudes con palabras clave: {similarities}")
+    # Si alguna similitud supera el umbral, consideramos la pregunta como relevante
+    return float(similarities.max()) > RELEVANCE_THRESHOLD
 
-    # Si alguna similitud es mayor a 0.75, consideramos la pregunta como relevante
-    return max(similarities) > 0.4
+RESPONSE_MODEL = "gpt-3.5-turbo"
 
-def generate_openai_response(user_query, similar_videos):
-    """Genera una respuesta basada en los videos más similares encontrados."""
+def build_response_prompt(user_query, similar_videos):
+    """Construye el prompt de respuesta con los videos más similares encontrados."""
 
     # Formatear los videos para que OpenAI los entienda correctamente
     context = "\n".join([
@@ -108,7 +359,7 @@ def generate_openai_response(user_query, similar_videos):
         for video in similar_videos
     ])
 
-    prompt = f"""
+    return f"""
     You are an AI assistant that answers questions about sponsors in YouTube videos.
 
     User question: "{user_query}"
@@ -118,23 +369,41 @@ def generate_openai_response(user_query, similar_videos):
     {context}
     """
 
-    response = client.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[{"role": "user", "content": prompt}]
-    )
+async def generate_openai_response(user_query, similar_videos):
+    """Genera una respuesta basada en los videos más similares encontrados."""
+
+    response = await _create_chat_completion(RESPONSE_MODEL, build_response_prompt(user_query, similar_videos))
 
     return response.choices[0].message.content
 
-def ask_chatgpt(user_message):
+async def generate_openai_response_stream(user_query, similar_videos):
+    """Igual que generate_openai_response, pero devuelve los fragmentos de texto a medida que llegan."""
+
+    prompt = build_response_prompt(user_query, similar_videos)
+    completion_chars = 0
+
+    await _wait_for_rate_limit()
+    async with track_call("openai", RESPONSE_MODEL):
+        stream = await get_openai_client().chat.completions.create(
+            model=RESPONSE_MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            stream=True
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                completion_chars += len(chunk.choices[0].delta.content)
+                yield chunk.choices[0].delta.content
+
+    # El streaming no informa del uso: se estima con la misma regla que los lotes de embeddings
+    record_openai_usage(RESPONSE_MODEL, estimate_tokens(prompt), completion_chars // 4)
+
+async def ask_chatgpt(user_message):
     """Genera una respuesta con IA para temas fuera del proyecto."""
     prompt = f"""You are a helpful AI assistant. Answer the following question:
 
     User: {user_message}
     AI:"""
 
-    response = client.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[{"role": "user", "content": prompt}]
-    )
+    response = await _create_chat_completion("gpt-3.5-turbo", prompt)
 
     return response.choices[0].message.content
\ No newline at end of file
@@ -0,0 +1,212 @@
+import hashlib
+import logging
+import os
+import re
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Configuración de la caché de embeddings (desde .env)
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+EMBEDDING_CACHE_DISK = os.getenv("EMBEDDING_CACHE_DISK", "0") == "1"
+CACHE_DIR = Path(os.getenv("CACHE_DIR", ".cache"))
+
+def normalize_text(text):
+    """Normaliza el texto para que variaciones triviales (espacios, Unicode) compartan entrada."""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+def cache_key(model, text):
+    """Clave direccionada por contenido: modelo + hash del texto normalizado."""
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return f"{model}:{digest}"
+
+class DiskEmbeddingStore:
+    """Almacén en disco de solo-anexar: vectores float32 en un fichero mapeado en memoria y claves en otro.
+
+    Cada línea de claves guarda "clave dimensión fila", con la fila calculada a partir del tamaño del fichero
+    de vectores bajo un bloqueo de fichero: varios procesos (workers de uvicorn o de la ingesta masiva) pueden
+    compartir el directorio, y un vector huérfano tras una caída no desalinea las filas siguientes.
+    """
+
+    def __init__(self, directory, dim=None):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.vectors_path = self.directory / "embeddings.f32"
+        self.keys_path = self.directory / "embeddings.keys"
+        self.lock_path = self.directory / "embeddings.lock"
+        self.dim = dim
+        self._rows = {}
+        self._keys_offset = 0
+        self._mmap = None
+        self._load_keys()
+
+    def __len__(self):
+        return len(self._rows)
+
+    @contextmanager
+    def _locked(self):
+        """Bloqueo exclusivo entre procesos (sin fcntl, p. ej. en Windows, solo protege un único proceso)."""
+        with open(self.lock_path, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _file_rows(self):
+        """Filas completas del fichero de vectores (un vector a medio escribir no cuenta)."""
+        if self.dim is None or not self.vectors_path.exists():
+            return 0
+        return self.vectors_path.stat().st_size // (self.dim * 4)
+
+    def _load_keys(self):
+        """Lee las claves añadidas desde la última lectura (también las escritas por otros procesos)."""
+        if not self.keys_path.exists() or self.keys_path.stat().st_size <= self._keys_offset:
+            return
+        with open(self.keys_path, "rb") as f:
+            f.seek(self._keys_offset)
+            data = f.read()
+        complete = data[:data.rfind(b"\n") + 1]  # Una línea sin salto final aún se está escribiendo
+        self._keys_offset += len(complete)
+
+        for line in complete.decode("utf-8").splitlines():
+            try:
+                key, dim, row = line.split(" ")
+                dim, row = int(dim), int(row)
+            except ValueError:
+                continue  # Línea dañada
+            self.dim = self.dim or dim
+            if dim == self.dim:
+                self._rows[key] = row
+
+        # Claves cuyo vector no está en el fichero (p. ej. fichero de vectores truncado): no son fiables
+        file_rows = self._file_rows()
+        invalid = [key for key, row in self._rows.items() if row >= file_rows]
+        for key in invalid:
+            del self._rows[key]
+        if invalid:
+            logger.warning("⚠️ Caché de embeddings: %d claves sin vector en disco, se descartan.", len(invalid))
+
+    def _vectors(self):
+        """Devuelve el memmap de vectores, reabriéndolo si el fichero ha crecido."""
+        rows = self._file_rows()
+        if self._mmap is None or self._mmap.shape[0] < rows:
+            self._mmap = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+        return self._mmap
+
+    def get(self, key):
+        row = self._rows.get(key)
+        if row is None:
+            self._load_keys()  # Puede haberla escrito otro proceso
+            row = self._rows.get(key)
+            if row is None:
+                return None
+        return np.array(self._vectors()[row])
+
+    def put(self, key, vector):
+        if key in self._rows:
+            return
+        vector = np.asarray(vector, dtype=np.float32)
+        if self.dim is None:
+            self.dim = vector.shape[0]
+        elif vector.shape[0] != self.dim:
+            return  # Otro modelo/dimensión: no se persiste en este almacén
+
+        with self._locked():
+            self._load_keys()
+            if key in self._rows:
+                return
+            row_bytes = self.dim * 4
+            with open(self.vectors_path, "ab") as f:
+                size = f.seek(0, os.SEEK_END)
+                if size % row_bytes:
+                    f.truncate(size - size % row_bytes)  # Descartar un vector a medio escribir
+                row = size // row_bytes
+                f.write(vector.tobytes())
+            # La clave se escribe después del vector: una caída entre ambos solo deja un vector huérfano
+            with open(self.keys_path, "ab") as f:
+                if f.seek(0, os.SEEK_END) > self._keys_offset:
+                    f.truncate(self._keys_offset)  # Descartar una línea cortada por una caída
+                f.write(f"{key} {self.dim} {row}\n".encode("utf-8"))
+                self._keys_offset = f.tell()
+        self._rows[key] = row
+
+class EmbeddingCache:
+    """Caché LRU en memoria de embeddings, con almacén opcional en disco y contadores de aciertos."""
+
+    def __init__(self, max_entries=EMBEDDING_CACHE_SIZE, disk_store=None):
+        self.max_entries = max_entries
+        self.disk_store = disk_store
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remember(self, key, vector):
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)  # Expulsar el menos usado recientemente
+
+    def get(self, model, text):
+        """Devuelve el embedding (np.float32) si está en caché, o None."""
+        key = cache_key(model, text)
+        vector = self._entries.get(key)
+        if vector is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+        if self.disk_store is not None:
+            vector = self.disk_store.get(key)
+            if vector is not None:
+                self._remember(key, vector)
+                self.hits += 1
+                self.disk_hits += 1
+                return vector
+
+        self.misses += 1
+        return None
+
+    def put(self, model, text, vector):
+        key = cache_key(model, text)
+        vector = np.asarray(vector, dtype=np.float32)
+        self._remember(key, vector)
+        if self.disk_store is not None:
+            self.disk_store.put(key, vector)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "disk_hits": self.disk_hits,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "disk_size": len(self.disk_store) if self.disk_store is not None else None
+        }
+
+_cache = None
+
+def get_embedding_cache():
+    """Devuelve la caché compartida, creando el almacén en disco si está activado."""
+    global _cache
+    if _cache is None:
+        disk_store = DiskEmbeddingStore(CACHE_DIR / "embeddings") if EMBEDDING_CACHE_DISK else None
+        _cache = EmbeddingCache(EMBEDDING_CACHE_SIZE, disk_store)
+    return _cache
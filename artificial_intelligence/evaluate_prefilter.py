@@ -0,0 +1,93 @@
+"""Evaluación offline del prefiltro de patrocinios.
+
+Compara la decisión del prefiltro con etiquetas de referencia y muestra, para cada umbral,
+precisión, exhaustividad y llamadas al LLM ahorradas.
+
+Uso:
+    python -m artificial_intelligence.evaluate_prefilter --input etiquetas.jsonl
+    python -m artificial_intelligence.evaluate_prefilter --from-mongo
+
+Cada línea del JSONL debe tener "description" y "sponsors" (lista de marcas; vacía si no hay patrocinio).
+
+Con --from-mongo se usan como referencia los patrocinadores ya guardados en MongoDB, pero solo de los videos
+ingeridos con el prefiltro desactivado (SPONSOR_PREFILTER=0, campo sponsor_prefilter=false): con el prefiltro
+activo, lo que descartó se guardó sin marcas y contaría como acierto, inflando la exhaustividad. Los videos
+sin ese campo (ingeridos antes de registrarlo) también se excluyen.
+"""
+import argparse
+import asyncio
+import json
+from artificial_intelligence.sponsor_prefilter import score_text, sponsored_paragraphs
+
+def load_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+async def load_from_mongo(limit):
+    from database.mongodb import get_videos_collection  # Import diferido: solo hace falta en este modo
+    query = {"description": {"$nin": [None, ""]}, "sponsor_prefilter": False}  # Sin el sesgo del propio prefiltro
+    cursor = get_videos_collection().find(query, {"description": 1, "sponsors": 1, "_id": 0})
+    videos = await cursor.to_list(length=limit)
+    return [
+        {"description": video["description"], "sponsors": [s["brand_name"] for s in video.get("sponsors", [])]}
+        for video in videos
+    ]
+
+def evaluate(samples, thresholds):
+    """Calcula métricas por umbral a partir de las puntuaciones del prefiltro."""
+    scored = [(score_text(sample["description"])[0], bool(sample["sponsors"])) for sample in samples]
+    total = len(scored)
+    positives = sum(label for _, label in scored)
+    report = []
+
+    for threshold in thresholds:
+        tp = sum(1 for score, label in scored if score >= threshold and label)
+        fp = sum(1 for score, label in scored if score >= threshold and not label)
+        fn = positives - tp
+        llm_calls = tp + fp
+        precision = tp / llm_calls if llm_calls else 0.0
+        recall = tp / positives if positives else 1.0
+        report.append({
+            "threshold": threshold,
+            "precision": round(precision, 3),
+            "recall": round(recall, 3),
+            "missed_sponsored": fn,
+            "llm_calls": llm_calls,
+            "llm_calls_saved": total - llm_calls,
+            "saved_pct": round(100 * (total - llm_calls) / total, 1) if total else 0.0
+        })
+    return report
+
+def paragraph_reduction(samples, threshold):
+    """Porcentaje de caracteres que dejan de enviarse al LLM en modo por párrafos."""
+    total_chars = sum(len(sample["description"]) for sample in samples)
+    sent_chars = sum(len(p) for sample in samples for p in sponsored_paragraphs(sample["description"], threshold))
+    return round(100 * (1 - sent_chars / total_chars), 1) if total_chars else 0.0
+
+def main():
+    parser = argparse.ArgumentParser(description="Evalúa el prefiltro local de patrocinios.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--input", help="JSONL con descripciones etiquetadas")
+    source.add_argument("--from-mongo", action="store_true", help="Usar como referencia los videos guardados en MongoDB con SPONSOR_PREFILTER=0")
+    parser.add_argument("--limit", type=int, default=10000, help="Máximo de videos a leer de MongoDB")
+    parser.add_argument("--thresholds", default="1,2,3,4,5,6", help="Umbrales a evaluar, separados por comas")
+    args = parser.parse_args()
+
+    samples = load_jsonl(args.input) if args.input else asyncio.run(load_from_mongo(args.limit))
+    samples = [sample for sample in samples if sample.get("description")]
+    if not samples:
+        print("❌ No hay descripciones para evaluar."
+              + (" Con --from-mongo solo cuentan los videos ingeridos con SPONSOR_PREFILTER=0." if args.from_mongo else ""))
+        return
+
+    thresholds = [int(t) for t in args.thresholds.split(",")]
+    positives = sum(1 for sample in samples if sample["sponsors"])
+    print(f"📊 {len(samples)} descripciones ({positives} con patrocinio)\n")
+    print(f"{'umbral':>6} {'precisión':>9} {'recall':>7} {'perdidos':>8} {'llamadas':>8} {'ahorradas':>9} {'%ahorro':>7} {'%chars párrafos':>15}")
+    for row in evaluate(samples, thresholds):
+        print(f"{row['threshold']:>6} {row['precision']:>9} {row['recall']:>7} {row['missed_sponsored']:>8} "
+              f"{row['llm_calls']:>8} {row['llm_calls_saved']:>9} {row['saved_pct']:>7} "
+              f"{paragraph_reduction(samples, row['threshold']):>15}")
+
+if __name__ == "__main__":
+    main()
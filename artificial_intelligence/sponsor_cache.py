@@ -0,0 +1,101 @@
+import hashlib
+import re
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime
+from pymongo import UpdateOne
+
+# Tamaño máximo de la capa en memoria (la capa persistente en MongoDB no tiene límite)
+LOCAL_CACHE_SIZE = 50000
+
+def normalize_description(text):
+    """Normaliza una descripción (o párrafo) para que variaciones triviales compartan entrada."""
+    text = unicodedata.normalize("NFC", text).lower()
+    return re.sub(r"\s+", " ", text).strip()
+
+def sponsor_cache_key(text, model, prompt_version):
+    """Clave de caché: hash del texto normalizado + versión del prompt + modelo."""
+    digest = hashlib.sha256(normalize_description(text).encode("utf-8")).hexdigest()
+    return f"{model}:{prompt_version}:{digest}"
+
+def split_paragraphs(description):
+    """Divide una descripción en párrafos separados por líneas en blanco."""
+    return [paragraph.strip() for paragraph in re.split(r"\n\s*\n", description) if paragraph.strip()]
+
+class SponsorCache:
+    """Caché de marcas extraídas: capa LRU en memoria y, si se configura, colección de MongoDB."""
+
+    def __init__(self, collection=None, max_entries=LOCAL_CACHE_SIZE):
+        self.collection = collection
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def use_collection(self, collection):
+        """Activa la persistencia en una colección de MongoDB."""
+        self.collection = collection
+
+    def _remember(self, key, brands):
+        self._entries[key] = brands
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_many(self, keys):
+        """Devuelve {clave: marcas} para las claves presentes en la caché."""
+        found = {}
+        missing = []
+        for key in keys:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                found[key] = self._entries[key]
+            else:
+                missing.append(key)
+
+        if missing and self.collection is not None:
+            async for entry in self.collection.find({"_id": {"$in": missing}}, {"brands": 1}):
+                found[entry["_id"]] = entry["brands"]
+                self._remember(entry["_id"], entry["brands"])
+
+        self.hits += len(found)
+        self.misses += len(set(keys)) - len(found)
+        return found
+
+    async def get(self, key):
+        return (await self.get_many([key])).get(key)
+
+    async def set(self, key, brands, model=None, prompt_version=None):
+        await self.set_many({key: brands}, model=model, prompt_version=prompt_version)
+
+    async def set_many(self, entries, model=None, prompt_version=None):
+        """Guarda {clave: marcas} en memoria y, si hay colección, en una sola escritura masiva sin orden."""
+        for key, brands in entries.items():
+            self._remember(key, brands)
+        if self.collection is not None and entries:
+            updated_at = datetime.utcnow()
+            await self.collection.bulk_write([
+                UpdateOne(
+                    {"_id": key},
+                    {"$set": {"brands": brands, "model": model, "prompt_version": prompt_version,
+                              "updated_at": updated_at}},
+                    upsert=True
+                )
+                for key, brands in entries.items()
+            ], ordered=False)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "size": len(self._entries),
+            "persistent": self.collection is not None
+        }
+
+_cache = SponsorCache()
+
+def get_sponsor_cache():
+    """Devuelve la caché de patrocinadores compartida."""
+    return _cache
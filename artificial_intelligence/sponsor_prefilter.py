@@ -0,0 +1,84 @@
+import os
+import re
+from artificial_intelligence.sponsor_cache import split_paragraphs
+
+# Umbral de puntuación a partir del cual un texto se envía al LLM (configurable desde .env)
+SPONSOR_PREFILTER_ENABLED = os.getenv("SPONSOR_PREFILTER", "1") == "1"
+SPONSOR_PREFILTER_THRESHOLD = int(os.getenv("SPONSOR_PREFILTER_THRESHOLD", "2"))
+
+# Dominios que no indican patrocinio (redes sociales y plataformas del propio creador)
+SOCIAL_DOMAINS = {
+    "youtube.com", "youtu.be", "instagram.com", "twitter.com", "x.com", "tiktok.com",
+    "twitch.tv", "discord.gg", "discord.com", "facebook.com", "fb.com", "threads.net",
+    "linktr.ee", "patreon.com", "kick.com", "spotify.com", "open.spotify.com", "t.me", "whatsapp.com"
+}
+
+# Acortadores y redes de afiliación: casi siempre son enlaces patrocinados
+AFFILIATE_DOMAINS = {
+    "amzn.to", "amazon.es", "amazon.com", "bit.ly", "geni.us", "tidd.ly", "go.skimresources.com",
+    "awin1.com", "shareasale.com", "clk.tradedoubler.com", "rstyle.me", "shorturl.at", "tinyurl.com"
+}
+
+# Términos de patrocinio (al estilo de KEYWORDS), en español e inglés
+SPONSOR_TERMS = [
+    "sponsor", "patrocinador", "patrocinado", "patrocinio", "publicidad", "anuncio", "afiliado",
+    "affiliate", "descuento", "discount", "colaboración", "collab", "promo", "promoción",
+    "gracias a", "thanks to", "brought to you", "cupón", "coupon", "oferta", "envío gratis",
+    "#ad", "#publi", "#sponsored", "#patrocinado"
+]
+
+# Diccionario base de marcas habituales en patrocinios de YouTube; se amplía con set_known_brands
+KNOWN_BRANDS = {
+    "nordvpn", "surfshark", "expressvpn", "raid shadow legends", "hellofresh", "squarespace",
+    "skillshare", "audible", "manscaped", "honey", "dashlane", "brilliant", "ridge", "keeps",
+    "chapka", "revolut", "n26", "airalo", "holafly", "myprotein", "hsn", "shein", "temu",
+    "aliexpress", "amazon", "corsair", "logitech", "razer", "hyperx", "secretlab", "fiverr",
+    "notion", "betterhelp", "factor", "magic spoon", "opera gx", "genshin impact"
+}
+
+URL_PATTERN = re.compile(r"https?://(?:www\.)?([^/\s?#]+)", re.IGNORECASE)
+COUPON_PATTERN = re.compile(
+    r"(?:c[oó]digo|code|cup[oó]n|coupon|promo)\s*(?:de descuento\s*)?[:\-]?\s*[\"'«“]?([A-Z0-9][A-Z0-9_\-]{2,})",
+    re.IGNORECASE
+)
+PERCENT_PATTERN = re.compile(r"\d{1,2}\s*%\s*(?:de\s+)?(?:descuento|dto|off)", re.IGNORECASE)
+
+_known_brands = set(KNOWN_BRANDS)
+
+def set_known_brands(brands):
+    """Amplía el diccionario de marcas conocidas (p. ej. con las ya detectadas en MongoDB)."""
+    _known_brands.update(brand.lower().strip() for brand in brands if isinstance(brand, str) and len(brand.strip()) > 2)
+
+def _domain_matches(domain, domains):
+    return any(domain == d or domain.endswith("." + d) for d in domains)
+
+def score_text(text):
+    """Puntúa un texto según las señales de patrocinio encontradas; devuelve (puntuación, señales)."""
+    lowered = text.lower()
+    signals = []
+
+    for domain in {match.lower() for match in URL_PATTERN.findall(text)}:
+        if _domain_matches(domain, SOCIAL_DOMAINS):
+            continue
+        signals.append(("affiliate_url" if _domain_matches(domain, AFFILIATE_DOMAINS) else "url", domain))
+
+    # Los códigos de descuento suelen ir en mayúsculas o llevar dígitos ("LOLA10"), no palabras normales
+    signals.extend(("coupon", code) for code in COUPON_PATTERN.findall(text)
+                   if code.isupper() or any(char.isdigit() for char in code))
+    signals.extend(("percent_off", match) for match in PERCENT_PATTERN.findall(text))
+    signals.extend(("term", term) for term in SPONSOR_TERMS if term in lowered)
+    signals.extend(("brand", brand) for brand in _known_brands
+                   if brand in lowered and re.search(rf"\b{re.escape(brand)}\b", lowered))
+
+    weights = {"affiliate_url": 3, "url": 1, "coupon": 3, "percent_off": 2, "term": 1, "brand": 2}
+    score = sum(weights[kind] for kind, _ in signals)
+    return score, signals
+
+def is_likely_sponsored(text, threshold=None):
+    """Indica si merece la pena enviar el texto al LLM."""
+    threshold = SPONSOR_PREFILTER_THRESHOLD if threshold is None else threshold
+    return score_text(text)[0] >= threshold
+
+def sponsored_paragraphs(description, threshold=None):
+    """Devuelve solo los párrafos de la descripción con señales de patrocinio."""
+    return [paragraph for paragraph in split_paragraphs(description) if is_likely_sponsored(paragraph, threshold)]
@@ -0,0 +1,546 @@
+"""Backends simulados para medir el rendimiento sin claves reales: YouTube Data API, OpenAI y MongoDB."""
+import asyncio
+import copy
+import hashlib
+import json
+import random
+import re
+from collections import Counter
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
+import httpx
+import numpy as np
+from monitoring.metrics import YOUTUBE_QUOTA_COST
+
+SPONSOR_BRANDS = ["NordVPN", "Chapka Direct", "MyProtein", "HelloFresh", "Raid Shadow Legends",
+                  "Holafly", "Revolut", "Surfshark", "Skillshare", "Audible", "Secretlab", "Temu"]
+TOPICS = ["viaje", "maquillaje", "gaming", "cocina", "fitness", "tecnología", "moda", "vlog", "música", "humor"]
+
+class FakeFailure(Exception):
+    """Error simulado de un backend."""
+
+class LatencyModel:
+    """Latencia (media y jitter, en segundos) y tasa de errores de un backend simulado."""
+
+    def __init__(self, mean=0.0, jitter=0.0, error_rate=0.0, seed=None):
+        self.mean = mean
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+
+    async def wait(self):
+        delay = max(0.0, self.mean + self._random.uniform(-self.jitter, self.jitter))
+        if delay:
+            await asyncio.sleep(delay)
+        return self._random.random() < self.error_rate
+
+# ---------------------------------------------------------------------------
+# Catálogo sintético
+# ---------------------------------------------------------------------------
+
+def synthetic_description(rng, sponsored):
+    """Descripción de video con (o sin) bloque de patrocinio al estilo de los creadores reales."""
+    paragraphs = [f"Nuevo video de {rng.choice(TOPICS)} 🎬 ¡Espero que os guste!"]
+    brands = []
+    if sponsored:
+        brands = rng.sample(SPONSOR_BRANDS, rng.randint(1, 2))
+        for brand in brands:
+            slug = re.sub(r"\W", "", brand)
+            code = slug.upper()[:6] + str(rng.randint(5, 30))
+            paragraphs.append(f"Consigue un 10% de descuento en {brand} con el código {code}: https://{slug.lower()}.com/ref")
+    paragraphs.append("Sígueme en https://instagram.com/creador y https://tiktok.com/@creador")
+    return "\n\n".join(paragraphs), brands
+
+def build_channels(n_channels, videos_per_channel, sponsored_ratio=0.4, shorts_ratio=0.3, seed=0):
+    """Genera canales sintéticos: {handle: {"id", "title", "videos": [...]}} con videos del más nuevo al más viejo."""
+    rng = random.Random(seed)
+    channels = {}
+    start = datetime(2025, 1, 1)
+    for c in range(n_channels):
+        channel_id = "UC" + hashlib.md5(f"channel{c}".encode()).hexdigest()[:22]
+        videos = []
+        for v in range(videos_per_channel):
+            description, brands = synthetic_description(rng, rng.random() < sponsored_ratio)
+            published = start + timedelta(hours=v * 12 + c)
+            videos.append({
+                "id": hashlib.md5(f"{c}-{v}".encode()).hexdigest()[:11],
+                "title": f"{rng.choice(TOPICS).capitalize()} #{v} del canal {c}",
+                "description": description,
+                "brands": brands,
+                "duration": rng.randint(15, 59) if rng.random() < shorts_ratio else rng.randint(200, 3600),
+                "published_at": published.strftime("%Y-%m-%dT%H:%M:%SZ")
+            })
+        videos.reverse()
+        channels[f"@canal{c}"] = {"id": channel_id, "title": f"Canal {c}", "videos": videos}
+    return channels
+
+def hashed_embedding(text, dim):
+    """Embedding determinista por hashing de palabras (de más de 3 letras): textos con palabras en común se parecen."""
+    vector = np.zeros(dim, dtype=np.float32)
+    for token in re.findall(r"\w{4,}", text.lower()):
+        digest = int.from_bytes(hashlib.md5(token.encode()).digest()[:8], "little")
+        vector[digest % dim] += 1.0 if (digest >> 63) & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+def build_catalog_documents(n_videos, dim, n_channels=100, seed=0):
+    """Documentos ya procesados (con sponsors y embedding compacto) para sembrar MongoDB.
+
+    El embedding se calcula con hashed_embedding sobre la temática y las marcas, así las preguntas del
+    benchmark que las mencionan superan el umbral de similitud igual que con embeddings reales.
+    """
+    from database.mongodb import build_video_document  # Diferido: depende de la configuración del benchmark
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    documents = []
+    for i in range(n_videos):
+        channel = i % n_channels
+        sponsors = rng.sample(SPONSOR_BRANDS, rng.randint(0, 2))
+        topic = rng.choice(TOPICS)
+        title = f"{topic.capitalize()} #{i}"
+        documents.append(build_video_document(
+            video_id=f"cat{i:08d}",
+            channel_name=f"Canal {channel}",
+            channel_id=f"UCcatalog{channel:06d}",
+            published_at=(start + timedelta(minutes=37 * i)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            sponsors=sponsors,
+            title=title,
+            description=None,
+            embedding=hashed_embedding(" ".join([topic, *sponsors]), dim)
+        ))
+    return documents
+
+# ---------------------------------------------------------------------------
+# YouTube Data API + WhatsApp Graph API (httpx.MockTransport)
+# ---------------------------------------------------------------------------
+
+class FakeGoogleAndGraphAPI:
+    """Servidor HTTP simulado para YouTube y WhatsApp; cuenta llamadas y cuota consumida."""
+
+    def __init__(self, channels, latency=None, whatsapp_latency=None):
+        self.channels = channels
+        self.latency = latency or LatencyModel()
+        self.whatsapp_latency = whatsapp_latency or LatencyModel()
+        self.by_id = {channel["id"]: channel for channel in channels.values()}
+        self.videos = {video["id"]: video for channel in channels.values() for video in channel["videos"]}
+        self.calls = Counter()
+        self.quota_units = 0
+        self.whatsapp_messages = []
+        self.whatsapp_attempts = 0
+        self.scripted = {}  # endpoint -> [(status, cabeceras)] que se devuelven antes de responder con normalidad
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def transport(self):
+        return httpx.MockTransport(self.handle)
+
+    def fail_next(self, endpoint, responses):
+        """Las próximas peticiones al endpoint (p. ej. "channels" o "messages") reciben estas respuestas de error."""
+        self.scripted.setdefault(endpoint, []).extend(responses)
+
+    def _scripted_response(self, endpoint):
+        pending = self.scripted.get(endpoint)
+        if not pending:
+            return None
+        status, headers = pending.pop(0)
+        return httpx.Response(status, headers=headers, json={"error": "inyectado"})
+
+    async def handle(self, request):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if request.url.host == "graph.facebook.com":
+                self.whatsapp_attempts += 1
+                failed = await self.whatsapp_latency.wait()
+                scripted = self._scripted_response("messages")
+                if scripted is not None:
+                    return scripted
+                if failed:
+                    return httpx.Response(503, json={"error": "fake"})
+                self.whatsapp_messages.append(json.loads(request.content))
+                return httpx.Response(200, json={"messages": [{"id": f"wamid.{len(self.whatsapp_messages)}"}]})
+
+            endpoint = request.url.path.rsplit("/", 1)[-1]
+            self.calls[endpoint] += 1
+            self.quota_units += YOUTUBE_QUOTA_COST.get(endpoint, 1)
+            if await self.latency.wait():
+                return httpx.Response(503, json={"error": "fake"})
+            scripted = self._scripted_response(endpoint)
+            if scripted is not None:
+                return scripted  # YouTube cobra cuota también por las peticiones fallidas
+
+            params = {key: values[0] for key, values in parse_qs(urlparse(str(request.url)).query).items()}
+            handler = getattr(self, f"_{endpoint}", None)
+            if handler is None:
+                return httpx.Response(404, json={"error": "unknown endpoint"})
+            return httpx.Response(200, json=handler(params))
+        finally:
+            self.in_flight -= 1
+
+    def _channels(self, params):
+        if "forHandle" in params:
+            channel = self.channels.get(params["forHandle"])
+            channels = [channel] if channel else []
+        else:
+            channels = [self.by_id[i] for i in params.get("id", "").split(",") if i in self.by_id]
+        return {"items": [{
+            "id": channel["id"],
+            "snippet": {"title": channel["title"]},
+            "contentDetails": {"relatedPlaylists": {"uploads": "UU" + channel["id"][2:]}}
+        } for channel in channels]}
+
+    def _search(self, params):
+        channel = self.by_id.get(params.get("channelId"))
+        videos = channel["videos"][:min(int(params.get("maxResults", 5)), 50)] if channel else []
+        return {"items": [{
+            "id": {"videoId": video["id"]},
+            "snippet": {"title": video["title"], "publishedAt": video["published_at"]}
+        } for video in videos]}
+
+    def _videos(self, params):
+        videos = [self.videos[i] for i in params.get("id", "").split(",") if i in self.videos][:50]
+        return {"items": [{
+            "id": video["id"],
+            "contentDetails": {"duration": f"PT{video['duration'] // 60}M{video['duration'] % 60}S"},
+            "snippet": {"title": video["title"], "description": video["description"], "publishedAt": video["published_at"]}
+        } for video in videos]}
+
+    def _playlistItems(self, params):
+        channel = self.by_id.get("UC" + params.get("playlistId", "")[2:])
+        videos = channel["videos"] if channel else []
+        page_size = min(int(params.get("maxResults", 5)), 50)
+        start = int(params.get("pageToken", 0))
+        page = videos[start:start + page_size]
+        data = {"items": [{
+            "snippet": {"title": video["title"], "publishedAt": video["published_at"]},
+            "contentDetails": {"videoId": video["id"], "videoPublishedAt": video["published_at"]}
+        } for video in page]}
+        if start + page_size < len(videos):
+            data["nextPageToken"] = str(start + page_size)
+        return data
+
+# ---------------------------------------------------------------------------
+# OpenAI (chat y embeddings)
+# ---------------------------------------------------------------------------
+
+class _FakeStream:
+    def __init__(self, text, chunk_delay):
+        self._chunks = re.findall(r"\S+\s*", text) or [text]
+        self._chunk_delay = chunk_delay
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for chunk in self._chunks:
+            if self._chunk_delay:
+                await asyncio.sleep(self._chunk_delay)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=chunk))])
+
+class FakeOpenAI:
+    """Cliente OpenAI simulado con la misma forma que openai.AsyncOpenAI para chat y embeddings."""
+
+    def __init__(self, dim=1536, chat_latency=None, embedding_latency=None, stream_chunk_delay=0.0):
+        self.dim = dim
+        self.chat_latency = chat_latency or LatencyModel()
+        self.embedding_latency = embedding_latency or LatencyModel()
+        self.stream_chunk_delay = stream_chunk_delay
+        self.calls = Counter()
+        self.tokens = Counter()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._chat_create))
+        self.embeddings = SimpleNamespace(create=self._embeddings_create)
+
+    async def _chat_create(self, model, messages, stream=False, **kwargs):
+        self.calls[f"chat:{model}"] += 1
+        prompt = messages[-1]["content"]
+        self.tokens[f"chat:{model}"] += len(prompt) // 4
+        if await self.chat_latency.wait():
+            raise FakeFailure("Fallo simulado de chat")
+
+        if "**Description:**" in prompt:
+            description = prompt.rsplit("**Description:**", 1)[1]
+            text = json.dumps([brand for brand in SPONSOR_BRANDS if brand.lower() in description.lower()])
+        else:
+            text = "Según los videos encontrados, estos son los patrocinadores más relevantes para tu pregunta."
+
+        if stream:
+            return _FakeStream(text, self.stream_chunk_delay)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=text))],
+            usage=SimpleNamespace(prompt_tokens=len(prompt) // 4, completion_tokens=len(text) // 4,
+                                  total_tokens=(len(prompt) + len(text)) // 4)
+        )
+
+    async def _embeddings_create(self, input, model, **kwargs):
+        texts = [input] if isinstance(input, str) else list(input)
+        self.calls[f"embeddings:{model}"] += 1
+        self.calls["embedding_inputs"] += len(texts)
+        self.tokens[f"embeddings:{model}"] += sum(len(text) // 4 for text in texts)
+        if await self.embedding_latency.wait():
+            raise FakeFailure("Fallo simulado de embeddings")
+        return SimpleNamespace(
+            data=[SimpleNamespace(index=i, embedding=hashed_embedding(text, self.dim).tolist()) for i, text in enumerate(texts)],
+            usage=SimpleNamespace(prompt_tokens=sum(len(text) // 4 for text in texts),
+                                  total_tokens=sum(len(text) // 4 for text in texts))
+        )
+
+    def chat_calls(self):
+        return sum(count for key, count in self.calls.items() if key.startswith("chat:"))
+
+    def embedding_calls(self):
+        return sum(count for key, count in self.calls.items() if key.startswith("embeddings:"))
+
+# ---------------------------------------------------------------------------
+# MongoDB en memoria (subconjunto de la API de Motor que usa el proyecto)
+# ---------------------------------------------------------------------------
+
+def _get_values(document, path):
+    """Valores de un campo con notación de puntos, aplanando listas (como hace MongoDB)."""
+    values = [document]
+    for part in path.split("."):
+        next_values = []
+        for value in values:
+            if isinstance(value, list):
+                value = [item.get(part) for item in value if isinstance(item, dict) and part in item]
+                next_values.extend(value)
+            elif isinstance(value, dict) and part in value:
+                next_values.append(value[part])
+        values = next_values
+    flattened = []
+    for value in values:
+        flattened.extend(value if isinstance(value, list) else [value])
+    return flattened if values else []
+
+def _match_condition(values, condition):
+    if not isinstance(condition, dict) or not any(key.startswith("$") for key in condition):
+        return condition in values or (condition is None and not values)
+
+    for operator, operand in condition.items():
+        if operator == "$exists":
+            if bool(values) != bool(operand):
+                return False
+        elif operator == "$in":
+            if not any(value in operand for value in values):
+                return False
+        elif operator == "$nin":
+            if any(value in operand for value in values) or (None in operand and not values):
+                return False
+        elif operator == "$ne":
+            if operand in values or (operand is None and not values):
+                return False
+        elif operator in ("$gte", "$gt", "$lte", "$lt"):
+            comparable = [value for value in values if value is not None and type(value) is type(operand)]
+            compare = {"$gte": lambda a: a >= operand, "$gt": lambda a: a > operand,
+                       "$lte": lambda a: a <= operand, "$lt": lambda a: a < operand}[operator]
+            if not any(compare(value) for value in comparable):
+                return False
+        else:
+            raise NotImplementedError(f"Operador no soportado en FakeMongo: {operator}")
+    return True
+
+def matches(document, query):
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(matches(document, sub_query) for sub_query in condition):
+                return False
+        elif not _match_condition(_get_values(document, key), condition):
+            return False
+    return True
+
+def _project(document, projection):
+    if not projection:
+        return copy.deepcopy(document)
+    include = {key for key, value in projection.items() if value and key != "_id"}
+    result = {key: copy.deepcopy(document[key]) for key in include if key in document}
+    if projection.get("_id", 1) and "_id" in document:
+        result["_id"] = document["_id"]
+    return result
+
+class FakeCursor:
+    def __init__(self, documents, projection, latency):
+        self._documents = documents
+        self._projection = projection
+        self._latency = latency
+
+    def sort(self, key, direction=1):
+        keys = key if isinstance(key, list) else [(key, direction)]
+        for field, order in reversed(keys):
+            self._documents.sort(key=lambda doc: (doc.get(field) is None, doc.get(field) or ""), reverse=order < 0)
+        return self
+
+    async def to_list(self, length=None):
+        await self._latency.wait()
+        documents = self._documents if length is None else self._documents[:length]
+        return [_project(document, self._projection) for document in documents]
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        await self._latency.wait()
+        for document in self._documents:
+            yield _project(document, self._projection)
+
+class FakeCollection:
+    """Colección en memoria con índices simples (como los de ensure_indexes) para no recorrer todo el catálogo."""
+
+    INDEXED_FIELDS = ("_id", "video_id", "channel_name", "sponsors.brand_name")
+
+    def __init__(self, latency=None):
+        self.latency = latency or LatencyModel()
+        self._documents = []
+        self._indexes = {field: {} for field in self.INDEXED_FIELDS}
+        self._next_id = 0
+        self.operations = Counter()
+
+    def _new_id(self):
+        self._next_id += 1
+        return f"oid{self._next_id}"
+
+    def _append(self, document):
+        document.setdefault("_id", self._new_id())
+        self._documents.append(document)
+        for field, index in self._indexes.items():
+            for value in set(_get_values(document, field)):
+                index.setdefault(value, []).append(document)
+
+    def _candidates(self, query):
+        """Documentos que pueden cumplir la consulta (usa los índices si filtra por una clave indexada)."""
+        for field, index in self._indexes.items():
+            condition = query.get(field)
+            if condition is None:
+                continue
+            if isinstance(condition, dict) and set(condition) == {"$in"}:
+                found = {id(document): document for value in condition["$in"] for document in index.get(value, ())}
+                return list(found.values())
+            if not isinstance(condition, dict):
+                return list(index.get(condition, ()))
+        return self._documents
+
+    def insert_many_raw(self, documents):
+        """Siembra documentos directamente (sin latencia) para preparar catálogos grandes."""
+        for document in documents:
+            self._append(document)
+
+    async def create_index(self, keys, **kwargs):
+        self.operations["create_index"] += 1
+
+    async def find_one(self, query, projection=None):
+        self.operations["find_one"] += 1
+        await self.latency.wait()
+        for document in self._candidates(query):
+            if matches(document, query):
+                return _project(document, projection)
+        return None
+
+    def find(self, query=None, projection=None, **kwargs):
+        self.operations["find"] += 1
+        return FakeCursor([d for d in self._candidates(query or {}) if matches(d, query or {})], projection, self.latency)
+
+    def aggregate(self, pipeline):
+        """Subconjunto de etapas de agregación: $match, $sort, $limit, $project (sin efecto), $unwind y $group con $sum."""
+        self.operations["aggregate"] += 1
+        documents = None
+        for stage in pipeline:
+            (operator, spec), = stage.items()
+            if operator == "$match":
+                source = self._candidates(spec) if documents is None else documents
+                documents = [copy.deepcopy(d) for d in source if matches(d, spec)]
+            elif operator == "$sort":
+                for field, order in reversed(list(spec.items())):
+                    documents.sort(key=lambda doc: (doc.get(field) is None, doc.get(field) or ""), reverse=order < 0)
+            elif operator == "$limit":
+                documents = documents[:spec]
+            elif operator == "$unwind":
+                spec = spec if isinstance(spec, dict) else {"path": spec}
+                field = spec["path"].lstrip("$")
+                unwound = []
+                for document in documents:
+                    values = document.get(field)
+                    if values:
+                        unwound.extend({**document, field: value} for value in values)
+                    elif spec.get("preserveNullAndEmptyArrays"):
+                        unwound.append({key: value for key, value in document.items() if key != field})
+                documents = unwound
+            elif operator == "$group":
+                groups = {}
+                path = spec["_id"].lstrip("$")
+                for document in documents:
+                    values = _get_values(document, path)
+                    key = values[0] if values else None
+                    group = groups.setdefault(key, {"_id": key})
+                    for name, accumulator in spec.items():
+                        if name != "_id":
+                            group[name] = group.get(name, 0) + accumulator["$sum"]
+                documents = list(groups.values())
+        return FakeCursor(documents or [], None, self.latency)
+
+    async def count_documents(self, query):
+        self.operations["count_documents"] += 1
+        await self.latency.wait()
+        return sum(1 for document in self._candidates(query) if matches(document, query))
+
+    async def distinct(self, field):
+        self.operations["distinct"] += 1
+        await self.latency.wait()
+        if field in self._indexes:
+            return [value for value in self._indexes[field] if value is not None]
+        return list(dict.fromkeys(value for document in self._documents for value in _get_values(document, field)))
+
+    async def insert_one(self, document):
+        self.operations["insert_one"] += 1
+        await self.latency.wait()
+        document = copy.deepcopy(document)
+        self._append(document)
+        return SimpleNamespace(inserted_id=document["_id"])
+
+    def _apply_update(self, query, update, upsert):
+        for document in self._candidates(query):
+            if matches(document, query):
+                document.update(copy.deepcopy(update.get("$set", {})))
+                for field in update.get("$unset", {}):
+                    document.pop(field, None)
+                return 1, None
+
+        if not upsert:
+            return 0, None
+        document = {key: value for key, value in query.items() if not key.startswith("$") and not isinstance(value, dict)}
+        document.update(copy.deepcopy(update.get("$setOnInsert", {})))
+        document.update(copy.deepcopy(update.get("$set", {})))
+        self._append(document)
+        return 0, document["_id"]
+
+    async def update_one(self, query, update, upsert=False):
+        self.operations["update_one"] += 1
+        await self.latency.wait()
+        matched, upserted_id = self._apply_update(query, update, upsert)
+        return SimpleNamespace(matched_count=matched, modified_count=matched, upserted_id=upserted_id)
+
+    async def bulk_write(self, operations, ordered=True):
+        self.operations["bulk_write"] += 1
+        await self.latency.wait()
+        upserted_ids = {}
+        for position, operation in enumerate(operations):
+            _, upserted_id = self._apply_update(operation._filter, operation._doc, operation._upsert)
+            if upserted_id is not None:
+                upserted_ids[position] = upserted_id
+        return SimpleNamespace(upserted_ids=upserted_ids)
+
+class FakeDatabase:
+    """Base de datos en memoria; cada colección se crea al primer acceso."""
+
+    def __init__(self, latency=None):
+        self.latency = latency or LatencyModel()
+        self._collections = {}
+
+    def __getitem__(self, name):
+        if name not in self._collections:
+            self._collections[name] = FakeCollection(self.latency)
+        return self._collections[name]
+
+    def operation_counts(self):
+        total = Counter()
+        for collection in self._collections.values():
+            total.update(collection.operations)
+        return dict(total)
@@ -0,0 +1,72 @@
+"""Presupuesto de tiempo de importación: cada módulo se importa en un intérprete nuevo y se mide la mediana.
+
+Uso:
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --runs 9 --json import_time.json
+
+Además del tiempo total, se mide el coste propio de la aplicación (import del módulo menos el de sus
+dependencias de terceros ya cargadas) y se comprueba que no se importan al arrancar los módulos que deben
+cargarse en diferido (openai, motor, httpx, uvicorn). Devuelve código 1 si se incumple algún presupuesto.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+# Módulo -> (dependencias de terceros que se descuentan, presupuesto en ms del coste propio de la aplicación)
+BUDGETS = {
+    "server": (["fastapi", "numpy", "pymongo", "dotenv", "isodate"], 250),
+    "artificial_intelligence.detect_sponsors": (["numpy", "pymongo", "dotenv"], 100),
+    "database.mongodb": (["numpy", "pymongo", "dotenv"], 150),
+    "pipeline.channel_pipeline": (["numpy", "pymongo", "dotenv", "isodate"], 150),
+}
+
+# Deben importarse solo al crear sus clientes (o al arrancar uvicorn), nunca al importar la aplicación
+DEFERRED_MODULES = ["openai", "motor", "httpx", "uvicorn"]
+
+_MEASURE = """
+import sys, time, json
+for name in {dependencies!r}:
+    __import__(name)
+start = time.perf_counter()
+__import__({module!r})
+elapsed = time.perf_counter() - start
+print(json.dumps({{"ms": elapsed * 1000, "loaded": [m for m in {deferred!r} if m in sys.modules]}}))
+"""
+
+def measure(module, dependencies, runs):
+    """Mediana (ms) del import de `module` en intérpretes nuevos con `dependencies` ya cargadas."""
+    samples, loaded = [], set()
+    code = _MEASURE.format(dependencies=dependencies, module=module, deferred=DEFERRED_MODULES)
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        samples.append(result["ms"])
+        loaded.update(result["loaded"])
+    return statistics.median(samples), sorted(loaded)
+
+def main():
+    parser = argparse.ArgumentParser(description="Mide el tiempo de importación de los módulos de la aplicación.")
+    parser.add_argument("--runs", type=int, default=5, help="Intérpretes nuevos por módulo")
+    parser.add_argument("--json", help="Guardar los resultados en este fichero JSON")
+    args = parser.parse_args()
+
+    results, failed = [], False
+    for module, (dependencies, budget_ms) in BUDGETS.items():
+        total_ms, _ = measure(module, [], args.runs)
+        own_ms, loaded = measure(module, dependencies, args.runs)
+        ok = own_ms <= budget_ms and not loaded
+        failed |= not ok
+        results.append({"module": module, "total_ms": round(total_ms, 1), "app_ms": round(own_ms, 1),
+                        "budget_ms": budget_ms, "eager_imports": loaded, "ok": ok})
+        print(f"{'✅' if ok else '❌'} {module}: {total_ms:.0f} ms en total, {own_ms:.0f} ms propios "
+              f"(presupuesto {budget_ms} ms){'; importa ' + ', '.join(loaded) if loaded else ''}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(results, file, ensure_ascii=False, indent=2)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
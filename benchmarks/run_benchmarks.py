@@ -0,0 +1,355 @@
+"""Benchmarks sin conexión de /procesar, /chat y /webhook con YouTube, OpenAI y MongoDB simulados.
+
+Uso:
+    python -m benchmarks.run_benchmarks
+    python -m benchmarks.run_benchmarks --catalog-size 100000 --dim 256 --scenarios chat
+    python -m benchmarks.run_benchmarks --catalog-size 1000000 --dim 64 --json resultados.json
+    python -m benchmarks.run_benchmarks --mongo-uri mongodb://localhost:27017/ --catalog-size 10000
+
+Cada escenario reporta latencia p50/p99, throughput y errores; /procesar además cuota de YouTube consumida
+y llamadas al LLM por video. El escenario retry comprueba la política de reintentos del cliente HTTP
+(Retry-After, 5xx en GET y POST no idempotentes) contra errores inyectados.
+Con --mongo-uri se usa un MongoDB local (base youtube_sponsors_bench, que se vacía).
+"""
+import os
+import sys
+import tempfile
+
+# La configuración debe fijarse antes de importar los módulos de la aplicación
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+os.environ.setdefault("GOOGLE_API", "benchmark-key")
+os.environ.setdefault("CACHE_DIR", tempfile.mkdtemp(prefix="bench-cache-"))
+os.environ.setdefault("SCAN_SCHEDULE_INTERVAL_SECONDS", "0")
+os.environ.setdefault("LOG_LEVEL", "WARNING")  # Solo avisos y errores de la aplicación (--verbose para INFO)
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+import httpx
+import numpy as np
+from benchmarks.fakes import FakeDatabase, FakeGoogleAndGraphAPI, FakeOpenAI, LatencyModel, build_catalog_documents, build_channels
+from network.http_client import http_get, set_http_client
+from artificial_intelligence.detect_sponsors import set_openai_client
+from monitoring.metrics import OPENAI_COST, OUTBOUND_CALLS, YOUTUBE_QUOTA_UNITS
+import database.mongodb as mongodb
+import whatsapp.whatsapp_bot as whatsapp_bot
+from server import app
+
+CHAT_QUESTIONS = [
+    "¿Qué marcas patrocinaron al Canal 3 en marzo?",
+    "¿Qué patrocinadores como NordVPN aparecen en videos de viaje?",
+    "Recomiéndame descuentos de MyProtein para fitness",
+    "¿Quién patrocina los videos de gaming además de Secretlab?",
+    "¿Qué videos subió el Canal 7 el año pasado?",
+    "¿Hay códigos de HelloFresh en videos de cocina?",
+]
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) * 1000 if values else 0.0
+
+def summarize(name, latencies, elapsed, errors, **extra):
+    """Resumen de un escenario: latencias en milisegundos y throughput en peticiones por segundo."""
+    return {
+        "scenario": name,
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "elapsed_s": round(elapsed, 3),
+        **extra
+    }
+
+async def run_concurrently(tasks, concurrency):
+    """Ejecuta corrutinas (fábricas sin argumentos) con concurrencia acotada; devuelve latencias y errores."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def timed(task):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await task()
+                latencies.append(time.perf_counter() - start)
+            except Exception:
+                errors += 1
+
+    await asyncio.gather(*(timed(task) for task in tasks))
+    return latencies, errors
+
+CHANNELS_URL = "https://www.googleapis.com/youtube/v3/channels?forHandle=@canal0&part=id&key=x"
+
+async def bench_http(google, args):
+    """Peticiones simultáneas por http_get (cliente compartido con reintentos): con el pool no deben serializarse."""
+    calls = args.requests
+    async def call():
+        response = await http_get(CHANNELS_URL)
+        response.raise_for_status()
+
+    start = time.perf_counter()
+    latencies, errors = await run_concurrently([call] * calls, args.concurrency)
+    elapsed = time.perf_counter() - start
+    serial = calls * args.youtube_latency
+    return summarize("http", latencies, elapsed, errors, max_in_flight=google.max_in_flight,
+                     speedup_vs_serial=round(serial / elapsed, 2) if elapsed and serial else None)
+
+def _outbound_attempts(service, operation):
+    """Intentos registrados en las métricas para un servicio y operación (todas las respuestas)."""
+    return sum(value for labels, value in OUTBOUND_CALLS._values.items() if labels[:2] == (service, operation))
+
+async def bench_retry(google, args):
+    """Política de reintentos de request_with_retry frente a errores inyectados en el servidor simulado.
+
+    Cada comprobación que no se cumple cuenta como un error del escenario.
+    """
+    checks = {}
+
+    async def check(name, endpoint, responses, request, expected_attempts, expected_status, min_wait=0.0):
+        service = "whatsapp" if endpoint == "messages" else "youtube"
+        served = (lambda: google.whatsapp_attempts) if service == "whatsapp" else (lambda: google.calls[endpoint])
+        google.fail_next(endpoint, responses)
+        before, metrics_before = served(), _outbound_attempts(service, endpoint)
+        start = time.perf_counter()
+        status = await request()
+        waited = time.perf_counter() - start
+        attempts, recorded = served() - before, _outbound_attempts(service, endpoint) - metrics_before
+        checks[name] = {
+            "status": status, "attempts": attempts, "metrics_attempts": recorded, "waited_s": round(waited, 3),
+            "ok": status == expected_status and attempts == recorded == expected_attempts and waited >= min_wait
+        }
+        latencies.append(waited)
+
+    async def get_channels():
+        return (await http_get(CHANNELS_URL)).status_code
+
+    async def send_message():
+        messages_before = len(google.whatsapp_messages)
+        await whatsapp_bot.send_whatsapp_message("34600000000", "prueba de reintentos")
+        return 200 if len(google.whatsapp_messages) > messages_before else 503
+
+    latencies = []
+    start = time.perf_counter()
+    # GET idempotente: un 429 (respetando Retry-After) y un 503 se reintentan hasta el 200
+    await check("get_429_retry_after_then_503", "channels", [(429, {"Retry-After": "1"}), (503, {})],
+                get_channels, expected_attempts=3, expected_status=200, min_wait=1.0)
+    # POST no idempotente: tras un 5xx no se reenvía (Meta pudo haber entregado ya el mensaje)
+    await check("post_503_not_resent", "messages", [(503, {})], send_message, expected_attempts=1, expected_status=503)
+    # POST no idempotente: un 429 indica que no se procesó, así que sí se reintenta
+    await check("post_429_retried", "messages", [(429, {"Retry-After": "0"})], send_message,
+                expected_attempts=2, expected_status=200)
+    elapsed = time.perf_counter() - start
+
+    errors = sum(not result["ok"] for result in checks.values())
+    return {**summarize("retry", latencies, elapsed, 0, checks=checks), "errors": errors, "requests": len(checks)}
+
+async def bench_procesar(client, google, openai_fake, channels, args):
+    """Encola el escaneo de cada canal y mide hasta que el trabajo termina (sondeando /jobs)."""
+    quota_before, chat_before = google.quota_units, openai_fake.chat_calls()
+    embeddings_before = openai_fake.calls["embedding_inputs"]
+    processed = 0
+
+    def scan(handle):
+        async def task():
+            nonlocal processed
+            job = (await client.get(f"/procesar/{handle}", params={"incremental": args.incremental})).json()
+            if "job_id" not in job:
+                raise RuntimeError(job.get("error"))
+            while True:
+                status = (await client.get(f"/jobs/{job['job_id']}")).json()
+                if status["status"] in ("done", "failed"):
+                    break
+                await asyncio.sleep(0.01)
+            if status["status"] == "failed":
+                raise RuntimeError(status.get("error"))
+            processed += len(status["result"].get("videos", []))
+        return task
+
+    start = time.perf_counter()
+    latencies, errors = await run_concurrently([scan(handle) for handle in channels], args.concurrency)
+    elapsed = time.perf_counter() - start
+    llm_calls = openai_fake.chat_calls() - chat_before
+    return summarize(
+        "procesar", latencies, elapsed, errors,
+        videos_processed=processed,
+        videos_per_s=round(processed / elapsed, 2) if elapsed else 0.0,
+        quota_units=google.quota_units - quota_before,
+        youtube_calls=dict(google.calls),
+        llm_calls=llm_calls,
+        llm_calls_per_video=round(llm_calls / processed, 3) if processed else None,
+        embedding_inputs=openai_fake.calls["embedding_inputs"] - embeddings_before
+    )
+
+async def bench_chat(client, openai_fake, args):
+    """Preguntas mezcladas (estructuradas, semánticas y repetidas) contra /chat, con y sin streaming."""
+    rng = random.Random(args.seed)
+    chat_before = openai_fake.chat_calls()
+
+    def ask(question, stream):
+        async def task():
+            response = await client.post("/chat", params={"stream": stream}, json={"message": question})
+            response.raise_for_status()
+        return task
+
+    tasks = [ask(rng.choice(CHAT_QUESTIONS), rng.random() < args.stream_ratio) for _ in range(args.requests)]
+    start = time.perf_counter()
+    latencies, errors = await run_concurrently(tasks, args.concurrency)
+    elapsed = time.perf_counter() - start
+    return summarize("chat", latencies, elapsed, errors, llm_calls=openai_fake.chat_calls() - chat_before,
+                     answer_cache=(await client.get("/cache/answers")).json())
+
+async def bench_webhook(client, google, args):
+    """Mide el acuse del webhook y el tiempo hasta que se envían todas las respuestas por WhatsApp."""
+    rng = random.Random(args.seed)
+    sent_before = len(google.whatsapp_messages)
+
+    def deliver(i):
+        async def task():
+            payload = {"entry": [{"changes": [{"value": {"messages": [{
+                "id": f"wamid.bench{i}", "from": f"34600{i:06d}", "text": {"body": rng.choice(CHAT_QUESTIONS)}
+            }]}}]}]}
+            response = await client.post("/webhook", json=payload)
+            response.raise_for_status()
+        return task
+
+    start = time.perf_counter()
+    latencies, errors = await run_concurrently([deliver(i) for i in range(args.requests)], args.concurrency)
+    acked = time.perf_counter() - start
+
+    expected = args.requests - errors
+    deadline = time.perf_counter() + args.timeout
+    while len(google.whatsapp_messages) - sent_before < expected and time.perf_counter() < deadline:
+        await asyncio.sleep(0.01)
+    replied = len(google.whatsapp_messages) - sent_before
+    elapsed = time.perf_counter() - start
+    return summarize("webhook", latencies, acked, errors, replies_sent=replied,
+                     replies_elapsed_s=round(elapsed, 3),
+                     replies_per_s=round(replied / elapsed, 2) if elapsed else 0.0)
+
+async def seed_catalog(database, args, is_fake):
+    documents = build_catalog_documents(args.catalog_size, args.dim, seed=args.seed)
+    if is_fake:
+        database["sponsored_videos"].insert_many_raw(documents)
+        return
+    await database.client.drop_database(database.name)
+    for start in range(0, len(documents), 10000):
+        await database["sponsored_videos"].insert_many(documents[start:start + 10000], ordered=False)
+
+async def run(args):
+    channels = build_channels(args.channels, args.videos_per_channel, seed=args.seed)
+    google = FakeGoogleAndGraphAPI(
+        channels,
+        latency=LatencyModel(args.youtube_latency, args.youtube_latency / 2, args.youtube_error_rate, seed=args.seed),
+        whatsapp_latency=LatencyModel(args.youtube_latency, args.youtube_latency / 2, seed=args.seed)
+    )
+    openai_fake = FakeOpenAI(
+        dim=args.dim,
+        chat_latency=LatencyModel(args.openai_latency, args.openai_latency / 2, args.openai_error_rate, seed=args.seed),
+        embedding_latency=LatencyModel(args.openai_latency / 4, args.openai_latency / 8, args.openai_error_rate, seed=args.seed)
+    )
+
+    set_http_client(httpx.AsyncClient(transport=google.transport()))
+    set_openai_client(openai_fake)
+    if args.mongo_uri:
+        import motor.motor_asyncio
+        database = motor.motor_asyncio.AsyncIOMotorClient(args.mongo_uri)["youtube_sponsors_bench"]
+    else:
+        database = FakeDatabase(LatencyModel(args.mongo_latency, args.mongo_latency / 2, seed=args.seed))
+    mongodb.use_database(database)
+
+    # Respuestas de WhatsApp sin esperas artificiales: se mide el pipeline, no la ventana de agrupado
+    whatsapp_bot.WHATSAPP_COALESCE_SECONDS = args.coalesce_seconds
+    whatsapp_bot.WHATSAPP_MIN_REPLY_INTERVAL_SECONDS = 0
+
+    seed_start = time.perf_counter()
+    await seed_catalog(database, args, is_fake=not args.mongo_uri)
+    results = []
+    if args.verbose:
+        logging.getLogger().setLevel(logging.INFO)
+
+    startup_start = time.perf_counter()
+    async with app.router.lifespan_context(app):
+        startup = time.perf_counter() - startup_start
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=args.timeout) as client:
+            for scenario in args.scenarios:
+                if scenario == "http":
+                    results.append(await bench_http(google, args))
+                elif scenario == "retry":
+                    results.append(await bench_retry(google, args))
+                elif scenario == "procesar":
+                    results.append(await bench_procesar(client, google, openai_fake, list(channels), args))
+                elif scenario == "chat":
+                    results.append(await bench_chat(client, openai_fake, args))
+                elif scenario == "webhook":
+                    results.append(await bench_webhook(client, google, args))
+            metrics_size = len((await client.get("/metrics")).text)
+
+    report = {
+        "config": {key: value for key, value in vars(args).items() if key != "json"},
+        "seed_s": round(startup_start - seed_start, 3),
+        "startup_s": round(startup, 3),
+        "scenarios": results,
+        "openai_calls": dict(openai_fake.calls),
+        "openai_tokens": dict(openai_fake.tokens),
+        "mongo_operations": database.operation_counts() if not args.mongo_uri else None,
+        # Lo que contabiliza la instrumentación de la aplicación (debe coincidir con los contadores de los fakes)
+        "metrics": {
+            "youtube_quota_units": sum(YOUTUBE_QUOTA_UNITS._values.values()),
+            "openai_cost_usd": round(sum(OPENAI_COST._values.values()), 6),
+            "exposition_bytes": metrics_size
+        }
+    }
+    return report
+
+def print_report(report):
+    print(f"📦 Catálogo: {report['config']['catalog_size']} videos (dim {report['config']['dim']}), "
+          f"sembrado en {report['seed_s']}s, arranque en {report['startup_s']}s")
+    for result in report["scenarios"]:
+        print(f"\n⏱️  {result['scenario']}: p50 {result['p50_ms']} ms · p99 {result['p99_ms']} ms · "
+              f"{result['throughput_rps']} req/s · {result['errors']} errores de {result['requests']}")
+        for key, value in result.items():
+            if key not in ("scenario", "p50_ms", "p99_ms", "throughput_rps", "errors", "requests"):
+                print(f"   {key}: {value}")
+    print(f"\n🤖 OpenAI: {report['openai_calls']}")
+    print(f"📈 /metrics: {report['metrics']}")
+    if report["mongo_operations"]:
+        print(f"🗄️  MongoDB: {report['mongo_operations']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks sin conexión de /procesar, /chat y /webhook.")
+    parser.add_argument("--scenarios", nargs="+", default=["http", "retry", "procesar", "chat", "webhook"],
+                        choices=["http", "retry", "procesar", "chat", "webhook"])
+    parser.add_argument("--catalog-size", type=int, default=1000, help="Videos ya procesados en MongoDB (1k–1M)")
+    parser.add_argument("--dim", type=int, default=1536, help="Dimensión de los embeddings (reducir para catálogos grandes)")
+    parser.add_argument("--channels", type=int, default=20, help="Canales sintéticos a escanear en /procesar")
+    parser.add_argument("--videos-per-channel", type=int, default=60)
+    parser.add_argument("--incremental", action="store_true", help="Escanear con la playlist de subidas")
+    parser.add_argument("--requests", type=int, default=200, help="Peticiones por escenario (http, chat, webhook)")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--stream-ratio", type=float, default=0.5, help="Fracción de /chat con ?stream=true")
+    parser.add_argument("--youtube-latency", type=float, default=0.05, help="Segundos por llamada a YouTube/WhatsApp")
+    parser.add_argument("--youtube-error-rate", type=float, default=0.0)
+    parser.add_argument("--openai-latency", type=float, default=0.2, help="Segundos por llamada de chat a OpenAI")
+    parser.add_argument("--openai-error-rate", type=float, default=0.0)
+    parser.add_argument("--mongo-latency", type=float, default=0.001, help="Segundos por operación de MongoDB simulado")
+    parser.add_argument("--mongo-uri", help="Usar un MongoDB local en lugar del simulado en memoria")
+    parser.add_argument("--coalesce-seconds", type=float, default=0.05)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Guardar el informe en este fichero JSON")
+    parser.add_argument("--verbose", action="store_true", help="Mostrar los logs de la aplicación")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(report, file, ensure_ascii=False, indent=2, default=str)
+    return 0 if not any(result["errors"] for result in report["scenarios"]) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,53 @@
+import os
+import numpy as np
+from bson.binary import Binary
+
+# Formato de almacenamiento de embeddings en MongoDB: "list" (legado), "float32" o "int8"
+EMBEDDING_STORAGE_FORMAT = os.getenv("EMBEDDING_STORAGE_FORMAT", "float32")
+
+# Campos que puede ocupar un embedding según su formato
+EMBEDDING_FIELDS = ["embedding", "embedding_f32", "embedding_q8", "embedding_scale", "embedding_norm"]
+EMBEDDING_PROJECTION = {field: 1 for field in EMBEDDING_FIELDS}
+
+def encode_embedding(embedding, storage_format=EMBEDDING_STORAGE_FORMAT):
+    """Devuelve los campos del documento que representan el embedding en el formato indicado.
+
+    - float32: bytes float32 little-endian (~6 KB para 1536 dimensiones, frente a ~12 KB de la lista BSON).
+    - int8: cuantización simétrica por vector con su escala (~1.5 KB); la norma original se guarda aparte.
+    """
+    if embedding is None:
+        return {"embedding": None}
+    if storage_format == "list":
+        return {"embedding": np.asarray(embedding, dtype=np.float64).tolist()}  # floats de Python: BSON no acepta np.float32
+
+    vector = np.asarray(embedding, dtype="<f4")
+    norm = float(np.linalg.norm(vector))
+
+    if storage_format == "float32":
+        return {"embedding_f32": Binary(vector.tobytes()), "embedding_norm": norm}
+
+    if storage_format == "int8":
+        max_abs = float(np.abs(vector).max()) if vector.size else 0.0
+        scale = max_abs / 127 if max_abs else 1.0
+        quantized = np.clip(np.round(vector / scale), -127, 127).astype(np.int8)
+        return {"embedding_q8": Binary(quantized.tobytes()), "embedding_scale": scale, "embedding_norm": norm}
+
+    raise ValueError(f"Formato de embedding desconocido: {storage_format}")
+
+def decode_embedding(document):
+    """Reconstruye el embedding (np.float32) de un documento en cualquiera de los formatos, o None."""
+    if document.get("embedding_f32") is not None:
+        return np.frombuffer(document["embedding_f32"], dtype="<f4").astype(np.float32)
+    if document.get("embedding_q8") is not None:
+        return np.frombuffer(document["embedding_q8"], dtype=np.int8).astype(np.float32) * document["embedding_scale"]
+    if document.get("embedding"):
+        return np.asarray(document["embedding"], dtype=np.float32)
+    return None
+
+def has_embedding_filter():
+    """Filtro de MongoDB para documentos con embedding en cualquier formato."""
+    return {"$or": [
+        {"embedding_f32": {"$exists": True}},
+        {"embedding_q8": {"$exists": True}},
+        {"embedding": {"$exists": True, "$nin": [None, []]}}
+    ]}
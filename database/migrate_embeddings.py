@@ -0,0 +1,74 @@
+"""Migra los embeddings guardados en MongoDB a otro formato de almacenamiento.
+
+Uso:
+    python -m database.migrate_embeddings --format float32
+    python -m database.migrate_embeddings --format int8 --batch-size 500
+    python -m database.migrate_embeddings --format float32 --dry-run
+
+Reescribe cada documento con los campos del nuevo formato y elimina los del anterior.
+Es idempotente: los documentos que ya están en el formato pedido se saltan.
+"""
+import argparse
+import asyncio
+import time
+from pymongo import UpdateOne
+from database.embedding_codec import EMBEDDING_FIELDS, EMBEDDING_PROJECTION, decode_embedding, encode_embedding
+from database.mongodb import get_videos_collection
+
+# Campo que identifica cada formato
+FORMAT_FIELD = {"list": "embedding", "float32": "embedding_f32", "int8": "embedding_q8"}
+
+def pending_filter(storage_format):
+    """Documentos con embedding que todavía no están en el formato pedido."""
+    target_field = FORMAT_FIELD[storage_format]
+    other_fields = [field for fmt, field in FORMAT_FIELD.items() if fmt != storage_format]
+    return {"$or": [{field: {"$exists": True, "$ne": None}} for field in other_fields],
+            target_field: {"$exists": False}}
+
+def build_update(document, storage_format):
+    """Operación que reescribe el embedding de un documento en el nuevo formato."""
+    vector = decode_embedding(document)
+    if vector is None:
+        return None
+    new_fields = encode_embedding(vector, storage_format)
+    unset = {field: "" for field in EMBEDDING_FIELDS if field not in new_fields}
+    return UpdateOne({"_id": document["_id"]}, {"$set": new_fields, "$unset": unset})
+
+async def migrate(storage_format, batch_size=1000, dry_run=False):
+    collection = get_videos_collection()
+    query = pending_filter(storage_format)
+    total = await collection.count_documents(query)
+    print(f"🔄 {total} documentos pendientes de migrar a '{storage_format}'.")
+    if dry_run or not total:
+        return 0
+
+    migrated = 0
+    started = time.perf_counter()
+    operations = []
+    async for document in collection.find(query, {"_id": 1, **EMBEDDING_PROJECTION}, batch_size=batch_size):
+        operation = build_update(document, storage_format)
+        if operation is not None:
+            operations.append(operation)
+        if len(operations) >= batch_size:
+            await collection.bulk_write(operations, ordered=False)
+            migrated += len(operations)
+            operations = []
+            print(f"   {migrated}/{total} migrados...")
+
+    if operations:
+        await collection.bulk_write(operations, ordered=False)
+        migrated += len(operations)
+
+    print(f"✅ {migrated} documentos migrados en {time.perf_counter() - started:.1f}s.")
+    return migrated
+
+def main():
+    parser = argparse.ArgumentParser(description="Migra los embeddings a un formato de almacenamiento compacto.")
+    parser.add_argument("--format", choices=sorted(FORMAT_FIELD), default="float32", help="Formato de destino")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Documentos por escritura masiva")
+    parser.add_argument("--dry-run", action="store_true", help="Solo contar los documentos pendientes")
+    args = parser.parse_args()
+    asyncio.run(migrate(args.format, args.batch_size, args.dry_run))
+
+if __name__ == "__main__":
+    main()
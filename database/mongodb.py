@@ -1,35 +1,128 @@
 from artificial_intelligence.detect_sponsors import generate_openai_embedding
-import motor.motor_asyncio # type: ignore
-import datetime
-from scipy.spatial.distance import cosine
-import motor.motor_asyncio
-from dateutil import parser
-from datetime import datetime, timedelta
-import re
-from pymongo.errors import DuplicateKeyError
-
-# Conectar a MongoDB de forma asíncrona
-MONGO_URI = "mongodb://localhost:27017/"
-client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URI)
-db = client["youtube_sponsors"]
-collection = db["sponsored_videos"]
+from artificial_intelligence.sponsor_cache import get_sponsor_cache
+from datetime import datetime
+import asyncio
+import logging
+import os
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+from database.embedding_codec import decode_embedding, encode_embedding
+from database.vector_index import get_vector_index, is_vector_index_loaded, load_vector_index, refresh_vector_index
+from database.query_planner import build_mongo_filter, format_brand_counts, format_structured_answer, plan_query
+from monitoring.metrics import MongoCommandMetrics
 
-async def save_to_mongodb(video_id, channel_name, channel_id, published_at, sponsors, title, description, embedding, collection):
-    """Guarda los datos en MongoDB asegurando que cada video sea único usando video_id, sin actualizar si ya existe."""
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY_ERROR = 11000  # Código de error de MongoDB para claves únicas duplicadas
+
+# Conexión a MongoDB (el cliente se crea en init_database, no al importar el módulo)
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
+MONGO_DATABASE = os.getenv("MONGO_DATABASE", "youtube_sponsors")
+client = None
+db = collection = sponsor_cache_collection = sync_state_collection = jobs_collection = watchlist_collection = None
+
+def use_database(database):
+    """Apunta todas las colecciones a la base de datos indicada (p. ej. una base en memoria para benchmarks)."""
+    global db, collection, sponsor_cache_collection, sync_state_collection, jobs_collection, watchlist_collection
+    db = database
+    collection = db["sponsored_videos"]
+    sponsor_cache_collection = db["sponsor_extraction_cache"]
+    sync_state_collection = db["channel_sync_state"]
+    jobs_collection = db["scan_jobs"]
+    watchlist_collection = db["scan_watchlist"]
+
+    # Persistir la caché de extracción de patrocinadores en MongoDB
+    get_sponsor_cache().use_collection(sponsor_cache_collection)
+
+def init_database():
+    """Crea el cliente asíncrono de MongoDB y apunta las colecciones a la base configurada.
+
+    Es idempotente y no sustituye una base ya elegida con use_database (p. ej. la de los benchmarks).
+    Devuelve la base de datos en uso.
+    """
+    global client
+    if db is None:
+        import motor.motor_asyncio
+        client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URI, event_listeners=[MongoCommandMetrics()])  # Latencia por comando en /metrics
+        use_database(client[MONGO_DATABASE])
+    return db
+
+def close_database():
+    """Cierra el cliente de MongoDB creado por init_database (si lo hay)."""
+    global client, db
+    if client is not None:
+        client.close()
+        client = db = None
+
+def get_videos_collection():
+    """Colección de videos, inicializando la conexión si hace falta (para scripts y CLIs)."""
+    init_database()
+    return collection
+
+_index_lock = asyncio.Lock()
+
+async def load_video_index():
+    """Carga en el índice vectorial los embeddings de la colección de videos (una sola vez aunque se llame a la vez)."""
+    async with _index_lock:
+        if not is_vector_index_loaded():
+            await load_vector_index(collection)
+    return get_vector_index()
+
+async def refresh_video_index():
+    """Incorpora al índice los videos que otros procesos guardaron después de cargarlo.
 
-    video_id = str(video_id).strip()
+    Devuelve los nombres de los canales con videos nuevos (vacío si el índice aún no se ha cargado:
+    la carga completa ya los incluirá).
+    """
+    async with _index_lock:
+        if not is_vector_index_loaded():
+            return set()
+        added = await refresh_vector_index(collection)
+    return {video["channel_name"] for video in added if video["channel_name"]}
 
-    data = {
-        "video_id": video_id,
+def _should_update_index():
+    """Solo se mantiene el índice en memoria si alguien lo usa: ya cargado o cargándose en este proceso.
+
+    Los procesos que solo ingieren (p. ej. los workers de la ingesta masiva) no lo cargan nunca.
+    """
+    return is_vector_index_loaded() or _index_lock.locked()
+
+async def ensure_indexes():
+    """Crea (si no existen) los índices que usan la ingesta y las consultas."""
+    await collection.create_index("video_id", unique=True)
+    await collection.create_index([("channel_id", ASCENDING), ("published_at", DESCENDING)])
+    await collection.create_index("channel_name")
+    await collection.create_index("sponsors.brand_name")
+    await collection.create_index("published_at")
+    await collection.create_index("ingested_at")  # Actualización incremental del índice vectorial
+    await jobs_collection.create_index([("status", ASCENDING), ("created_at", ASCENDING)])
+
+def build_video_document(video_id, channel_name, channel_id, published_at, sponsors, title, description, embedding,
+                         sponsor_prefilter=None):
+    """Construye el documento que se guarda en MongoDB para un video.
+
+    sponsor_prefilter indica si el prefiltro de patrocinios estaba activo al extraer las marcas (None si no se sabe):
+    con el prefiltro, las descripciones que descartó se guardan sin marcas aunque las tengan.
+    """
+    return {
+        "video_id": str(video_id).strip(),
         "title": title,
         "channel_name": channel_name,
         "channel_id": channel_id,
         "published_at": published_at,
         "sponsors": [{"brand_name": sponsor} for sponsor in sponsors],
         "description": description,
-        "embedding": embedding
+        "sponsor_prefilter": sponsor_prefilter,
+        "ingested_at": datetime.utcnow(),
+        **encode_embedding(embedding)  # Formato compacto según EMBEDDING_STORAGE_FORMAT
     }
 
+async def save_to_mongodb(video_id, channel_name, channel_id, published_at, sponsors, title, description, embedding, collection):
+    """Guarda los datos en MongoDB asegurando que cada video sea único usando video_id, sin actualizar si ya existe."""
+
+    data = build_video_document(video_id, channel_name, channel_id, published_at, sponsors, title, description, embedding)
+    video_id = data["video_id"]
+
     # 🔹 Intentamos actualizar solo si no existe
     result = await collection.update_one(
         {"video_id": video_id},  # Condición de búsqueda
@@ -38,77 +131,214 @@ async def save_to_mongodb(video_id, channel_name, channel_id, published_at, spon
     )
 
     if result.matched_count == 0:
-        print(f"✅ Video {video_id} guardado en MongoDB.")
+        logger.info("✅ Video %s guardado en MongoDB.", video_id)
+        if embedding and result.upserted_id is not None and _should_update_index():
+            get_vector_index().add([video_id], [embedding])  # Mantener el índice vectorial al día
     else:
-        print(f"⚠️ El video {video_id} ya existe en MongoDB. Saltando...")
+        logger.info("⚠️ El video %s ya existe en MongoDB. Saltando...", video_id)
+
+async def get_existing_video_ids(video_ids):
+    """Devuelve el conjunto de video_ids que ya existen en MongoDB (una sola consulta $in)."""
+    video_ids = [str(video_id).strip() for video_id in video_ids]
+    if not video_ids:
+        return set()
+    cursor = collection.find({"video_id": {"$in": video_ids}}, {"video_id": 1, "_id": 0})
+    return {video["video_id"] async for video in cursor}
+
+async def bulk_save_to_mongodb(documents):
+    """Inserta varios videos en una sola operación bulk_write (sin orden), sin modificar los que ya existen.
+
+    Devuelve (video_ids insertados, fallos), donde fallos es una lista de {"video_id", "error"} con las
+    escrituras que no se aplicaron por un motivo distinto de una clave duplicada (video ya existente).
+    """
+    if not documents:
+        return [], []
+
+    operations = [
+        UpdateOne({"video_id": document["video_id"]}, {"$setOnInsert": document}, upsert=True)
+        for document in documents
+    ]
+
+    failures = []
+    try:
+        result = await collection.bulk_write(operations, ordered=False)
+        upserted_positions = list(result.upserted_ids.keys())
+    except BulkWriteError as e:
+        # Con escrituras sin orden, el resto de operaciones se aplican aunque alguna falle
+        upserted_positions = [upserted["index"] for upserted in e.details.get("upserted", [])]
+        for error in e.details.get("writeErrors", []):
+            if error.get("code") == DUPLICATE_KEY_ERROR:
+                continue  # Insertado a la vez por otro proceso: ya existe
+            failures.append({"video_id": documents[error["index"]]["video_id"], "error": error.get("errmsg", str(error))})
+        if failures:
+            logger.error("❌ %d videos no se pudieron guardar en MongoDB: %s", len(failures), failures[0]["error"])
+
+    inserted = [documents[position] for position in upserted_positions]
+
+    # Mantener el índice vectorial al día (si este proceso lo usa)
+    vectors = [(document["video_id"], decode_embedding(document)) for document in inserted] if _should_update_index() else []
+    vectors = [(video_id, vector) for video_id, vector in vectors if vector is not None]
+    if vectors:
+        get_vector_index().add([video_id for video_id, _ in vectors], [vector for _, vector in vectors])
+
+    logger.info("✅ %d videos guardados en MongoDB (%d ya existían, %d fallidos).",
+                len(inserted), len(documents) - len(inserted) - len(failures), len(failures))
+    return [document["video_id"] for document in inserted], failures
+
+async def get_channel_watermark(channel_id):
+    """Devuelve la marca de agua de sincronización del canal ({"video_id", "published_at"}) o None."""
+    state = await sync_state_collection.find_one({"_id": channel_id}, {"video_id": 1, "published_at": 1, "_id": 0})
+    return state or None
+
+async def set_channel_watermark(channel_id, video_id, published_at):
+    """Guarda el último video ingerido del canal para la próxima sincronización incremental."""
+    await sync_state_collection.update_one(
+        {"_id": channel_id},
+        {"$set": {"video_id": video_id, "published_at": published_at, "synced_at": datetime.utcnow()}},
+        upsert=True
+    )
+
+async def create_scan_job(job):
+    """Guarda un nuevo trabajo de escaneo."""
+    await jobs_collection.insert_one(job)
+
+async def update_scan_job(job_id, fields):
+    """Actualiza campos de un trabajo de escaneo (estado, progreso, resultado...)."""
+    await jobs_collection.update_one({"_id": job_id}, {"$set": fields})
+
+async def get_scan_job(job_id):
+    """Devuelve un trabajo de escaneo por su ID, o None."""
+    return await jobs_collection.find_one({"_id": job_id})
+
+async def get_unfinished_scan_jobs():
+    """Trabajos que quedaron en cola o en ejecución (p. ej. tras un reinicio)."""
+    return await jobs_collection.find({"status": {"$in": ["queued", "running"]}}).sort("created_at", ASCENDING).to_list(length=None)
+
+async def get_watchlist():
+    """Devuelve los handles de la lista de canales que se re-sincronizan periódicamente."""
+    return [entry["_id"] async for entry in watchlist_collection.find({}, {"_id": 1})]
+
+async def add_to_watchlist(handle):
+    """Añade un canal a la lista de re-sincronización periódica."""
+    await watchlist_collection.update_one({"_id": handle}, {"$setOnInsert": {"added_at": datetime.utcnow()}}, upsert=True)
+
+async def get_known_brands():
+    """Devuelve las marcas ya detectadas en la base de datos."""
+    return await collection.distinct("sponsors.brand_name")
 
 async def channel_exists(channel_name):
     """Verifica si un canal existe en la base de datos."""
     channel = await collection.find_one({"channel_name": channel_name})
     return channel is not None  # Retorna True si el canal existe, False si no
 
-def extract_date_range(user_query):
-    """Extrae un rango de fechas basado en la consulta del usuario."""
-    now = datetime.utcnow()
-
-    # Detectar "últimos X meses"
-    match = re.search(r"últimos (\d+) meses", user_query.lower())
-    if match:
-        months = int(match.group(1))
-        start_date = now - timedelta(days=months * 30)  # Aproximado
-        return start_date.isoformat(), now.isoformat()
-
-    # Detectar meses específicos ("marzo", "enero", etc.)
-    months_dict = {
-        "enero": 1, "febrero": 2, "marzo": 3, "abril": 4, "mayo": 5, "junio": 6,
-        "julio": 7, "agosto": 8, "septiembre": 9, "octubre": 10, "noviembre": 11, "diciembre": 12
-    }
-    for month, num in months_dict.items():
-        if month in user_query.lower():
-            year = now.year  # Suponemos el año actual
-            start_date = datetime(year, num, 1)
-            end_date = datetime(year, num + 1, 1) - timedelta(days=1)  # Último día del mes
-            return start_date.isoformat(), end_date.isoformat()
+# Nombres de canales y marcas conocidos, para el planificador de consultas (se refrescan cada cierto tiempo)
+CATALOG_TTL_SECONDS = 300
+_catalog = {"channels": [], "brands": [], "loaded_at": None}
+_catalog_lock = asyncio.Lock()
+
+def _catalog_expired():
+    loaded_at = _catalog["loaded_at"]
+    return loaded_at is None or (datetime.utcnow() - loaded_at).total_seconds() > CATALOG_TTL_SECONDS
+
+async def get_catalog_terms():
+    """Devuelve (canales, marcas) distintos de la colección, con una caché de CATALOG_TTL_SECONDS.
+
+    Las consultas simultáneas con la caché caducada esperan a un único refresco en lugar de lanzar cada una
+    sus propios distinct.
+    """
+    if _catalog_expired():
+        async with _catalog_lock:
+            if _catalog_expired():
+                _catalog["channels"] = await collection.distinct("channel_name")
+                _catalog["brands"] = await collection.distinct("sponsors.brand_name")
+                _catalog["loaded_at"] = datetime.utcnow()
+    return _catalog["channels"], _catalog["brands"]
 
-    # Detectar "primer video"
-    if "primer video" in user_query.lower():
-        return "first", "first"  # Indicador especial para buscar el más antiguo
+async def plan_user_query(user_query):
+    """Planifica la consulta con los canales y marcas conocidos."""
+    channel_names, brand_names = await get_catalog_terms()
+    return plan_query(user_query, channel_names, brand_names)
 
-    return None, None  # No se detectó fecha
+async def find_filtered_videos(plan, limit=50):
+    """Videos que cumplen los filtros del plan, usando solo campos indexados."""
+    projection = {"video_id": 1, "title": 1, "sponsors": 1, "published_at": 1, "channel_name": 1, "_id": 0}
+    sort_order = ASCENDING if plan.first_video else DESCENDING
+    cursor = collection.find(build_mongo_filter(plan), projection).sort("published_at", sort_order)
+    return await cursor.to_list(length=1 if plan.first_video else limit)
 
-async def find_similar_videos(user_query, top_n=3):
-    """Encuentra los videos más similares a la consulta del usuario basándose únicamente en similitud de coseno."""
+async def count_brands(plan):
+    """Número de videos por marca entre todos los que cumplen los filtros del plan (agregación, sin límite).
+
+    Los videos sin patrocinadores se agrupan con _id None, para distinguir "sin videos" de "sin patrocinadores".
+    """
+    pipeline = [{"$match": build_mongo_filter(plan)}]
+    if plan.first_video:
+        pipeline += [{"$sort": {"published_at": ASCENDING}}, {"$limit": 1}]
+    pipeline += [
+        {"$project": {"sponsors.brand_name": 1, "_id": 0}},
+        {"$unwind": {"path": "$sponsors", "preserveNullAndEmptyArrays": True}},
+        {"$group": {"_id": "$sponsors.brand_name", "videos": {"$sum": 1}}}
+    ]
+    return await collection.aggregate(pipeline).to_list(length=None)
+
+async def answer_structured_query(user_query, plan=None):
+    """Responde sin embeddings ni LLM las preguntas puramente estructuradas; devuelve None si no lo es."""
+    plan = plan or await plan_user_query(user_query)
+    if not plan.is_structured():
+        return None
+    logger.debug("🧭 Consulta estructurada: %s", plan)
+    if plan.intent == "brands":
+        return format_brand_counts(plan, await count_brands(plan))
+    return format_structured_answer(plan, await find_filtered_videos(plan))
 
-    query_embedding = generate_openai_embedding(user_query)  
+async def find_similar_videos(user_query, top_n=3, query_embedding=None, plan=None):
+    """Encuentra los videos más similares a la consulta del usuario.
+
+    Primero se aplican como filtros de MongoDB los canales, marcas y fechas mencionados en la consulta,
+    y después se ordenan por similitud de coseno solo los videos que los cumplen.
+    """
+
+    plan = plan or await plan_user_query(user_query)
+    candidate_ids = None
+    if plan.first_video:
+        return await find_filtered_videos(plan) or None
+    if plan.has_filters():
+        candidates = await collection.find(build_mongo_filter(plan), {"video_id": 1, "_id": 0}).to_list(length=None)
+        candidate_ids = [video["video_id"] for video in candidates]
+        if not candidate_ids:
+            logger.debug("⚠️ Ningún video cumple los filtros de la consulta, devolviendo None.")
+            return None
+
+    if query_embedding is None:
+        query_embedding = await generate_openai_embedding(user_query)
 
     # Definir un umbral de similitud mínima para evitar respuestas incorrectas
     THRESHOLD = 0.35  # 🔥 Ajusta este valor si es necesario
 
-    # Obtener todos los videos en la base de datos
-    videos = await collection.find({}, {
-        "video_id": 1, "title": 1, "embedding": 1, "sponsors": 1, "description": 1, 
-        "published_at": 1, "channel_name": 1, "_id": 0
-    }).to_list(length=100)
-
-    # Comparar embeddings con la consulta
-    similarities = []
-    for video in videos:
-        if "embedding" in video and video["embedding"]:
-            similarity = 1 - cosine(query_embedding, video["embedding"])
-            similarities.append((video, similarity))
+    # Cargar el índice vectorial la primera vez que se necesite (o esperar a la carga del arranque)
+    if not is_vector_index_loaded():
+        await load_video_index()
 
-    # Ordenar por similitud de coseno (de mayor a menor)
-    similarities.sort(key=lambda x: x[1], reverse=True)
+    # Top-k sobre el índice en memoria (un único producto matriz-vector), restringido a los candidatos
+    similarities = get_vector_index().search(query_embedding, top_n, candidate_ids=candidate_ids)
 
-    # 🔍 Imprimir las similitudes para depuración
-    print("\n📊 Similitudes de coseno calculadas:")
-    for video, sim in similarities:
-        print(f"🎥 Video: {video['title']} - 🔥 Similitud: {sim:.3f}")
+    # 🔍 Similitudes solo en nivel DEBUG (sin coste de formateo si está desactivado)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("📊 Similitudes de coseno calculadas: %s",
+                     ", ".join(f"{video_id}={sim:.3f}" for video_id, sim in similarities))
 
     # Si la mejor similitud es menor que el umbral, devolver None
-    if similarities and similarities[0][1] < THRESHOLD:
-        print("⚠️ Ninguna coincidencia relevante encontrada, devolviendo None.")
+    if not similarities or similarities[0][1] < THRESHOLD:
+        logger.debug("⚠️ Ninguna coincidencia relevante encontrada, devolviendo None.")
         return None
 
-    return [video[0] for video in similarities[:top_n]] if similarities else None
+    # Segunda fase: obtener solo los documentos del top-k, sin descripción ni embedding,
+    # respetando el orden por similitud
+    ranked_ids = [video_id for video_id, _ in similarities]
+    videos = await collection.find({"video_id": {"$in": ranked_ids}}, {
+        "video_id": 1, "title": 1, "sponsors": 1,
+        "published_at": 1, "channel_name": 1, "_id": 0
+    }).to_list(length=len(ranked_ids))
+    videos_by_id = {video["video_id"]: video for video in videos}
 
+    return [videos_by_id[video_id] for video_id in ranked_ids if video_id in videos_by_id] or None
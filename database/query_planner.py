@@ -0,0 +1,150 @@
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+MONTHS = {
+    "enero": 1, "febrero": 2, "marzo": 3, "abril": 4, "mayo": 5, "junio": 6,
+    "julio": 7, "agosto": 8, "septiembre": 9, "octubre": 10, "noviembre": 11, "diciembre": 12,
+    # Inglés ("may" se omite por ambiguo)
+    "january": 1, "february": 2, "march": 3, "april": 4, "june": 6, "july": 7,
+    "august": 8, "september": 9, "october": 10, "november": 11, "december": 12
+}
+
+# Preguntas que se responden solo con metadatos (sin embeddings ni LLM)
+BRANDS_QUESTION = re.compile(
+    r"\b(que|cuales|which|what)\s+(marcas|patrocinadores|sponsors|brands)\b|"
+    r"\b(quien|quienes|who)\s+(patrocin\w*|sponsor\w*)|"
+    r"\b(marcas|patrocinadores|sponsors|brands)\s+(de|of|en|in)\b"
+)
+VIDEOS_QUESTION = re.compile(
+    r"\b(que|cuales|which|what)\s+(videos|canales|youtubers|channels|creators)\b|"
+    r"\b(donde|where)\s+(aparece|sale|salio|appears)\b"
+)
+
+def normalize_query_text(text):
+    """Minúsculas y sin tildes, para comparar nombres sin depender de cómo se escriban."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(char for char in text if not unicodedata.combining(char))
+
+def extract_date_range(user_query, now=None):
+    """Extrae un rango de fechas (ISO, ambos extremos inclusivos) basado en la consulta del usuario."""
+    now = now or datetime.utcnow()
+    query = normalize_query_text(user_query)
+
+    # Detectar "últimos X meses"
+    match = re.search(r"ultimos (\d+) meses", query)
+    if match:
+        months = int(match.group(1))
+        start_date = now - timedelta(days=months * 30)  # Aproximado
+        return start_date.isoformat(), now.isoformat()
+
+    # Detectar meses específicos ("marzo", "enero", etc.)
+    for month, num in MONTHS.items():
+        if re.search(rf"\b{month}\b", query):
+            year = now.year if num <= now.month else now.year - 1  # El último mes con ese nombre
+            start_date = datetime(year, num, 1)
+            next_month = datetime(year + 1, 1, 1) if num == 12 else datetime(year, num + 1, 1)
+            end_date = next_month - timedelta(microseconds=1)  # Hasta el final del último día del mes
+            return start_date.isoformat(), end_date.isoformat()
+
+    # Detectar "primer video"
+    if "primer video" in query:
+        return "first", "first"  # Indicador especial para buscar el más antiguo
+
+    return None, None  # No se detectó fecha
+
+def _find_names(query, names):
+    """Nombres del catálogo que aparecen en la consulta como palabras completas."""
+    found = []
+    for name in names:
+        normalized = normalize_query_text(name).strip()
+        if len(normalized) >= 3 and re.search(rf"(?<!\w){re.escape(normalized)}(?!\w)", query):
+            found.append(name)
+    return found
+
+@dataclass
+class QueryPlan:
+    """Filtros estructurados extraídos de una consulta antes de la búsqueda vectorial."""
+    channel_names: list = field(default_factory=list)
+    brand_names: list = field(default_factory=list)
+    start_date: str = None
+    end_date: str = None
+    first_video: bool = False
+    intent: str = None  # "brands", "videos" o None (búsqueda semántica)
+
+    def has_filters(self):
+        return bool(self.channel_names or self.brand_names or self.start_date or self.first_video)
+
+    def is_structured(self):
+        """Indica si la pregunta puede responderse solo con metadatos."""
+        if self.intent == "brands":
+            return bool(self.channel_names or self.start_date or self.first_video)
+        if self.intent == "videos":
+            return bool(self.brand_names)
+        return False
+
+def plan_query(user_query, channel_names, brand_names):
+    """Extrae canales, marcas y rango de fechas de la consulta usando los nombres conocidos del catálogo."""
+    query = normalize_query_text(user_query)
+    plan = QueryPlan(
+        channel_names=_find_names(query, channel_names),
+        brand_names=_find_names(query, brand_names)
+    )
+
+    start_date, end_date = extract_date_range(user_query)
+    if start_date == "first":
+        plan.first_video = True
+    elif start_date:
+        plan.start_date, plan.end_date = start_date, end_date
+
+    if BRANDS_QUESTION.search(query):
+        plan.intent = "brands"
+    elif VIDEOS_QUESTION.search(query):
+        plan.intent = "videos"
+    return plan
+
+def build_mongo_filter(plan):
+    """Traduce el plan a un filtro de MongoDB sobre campos indexados."""
+    mongo_filter = {}
+    if plan.channel_names:
+        mongo_filter["channel_name"] = {"$in": plan.channel_names}
+    if plan.brand_names:
+        mongo_filter["sponsors.brand_name"] = {"$in": plan.brand_names}
+    if plan.start_date:
+        mongo_filter["published_at"] = {"$gte": plan.start_date, "$lte": plan.end_date}
+    return mongo_filter
+
+def _scope_text(plan):
+    scope = []
+    if plan.channel_names:
+        scope.append(f"en {', '.join(plan.channel_names)}")
+    if plan.start_date:
+        scope.append(f"entre {plan.start_date[:10]} y {plan.end_date[:10]}")
+    if plan.first_video:
+        scope.append("en el primer video")
+    return " ".join(scope)
+
+def format_structured_answer(plan, videos):
+    """Redacta la respuesta a una pregunta por videos (intención "videos") a partir de los videos filtrados."""
+    if not videos:
+        return f"No encontré videos {_scope_text(plan)}".strip() + "."
+
+    lines = [f"- {video['title']} ({video['channel_name']}, {str(video.get('published_at', ''))[:10]})" for video in videos]
+    return f"Videos patrocinados por {', '.join(plan.brand_names)}:\n" + "\n".join(lines)
+
+def format_brand_counts(plan, brand_counts):
+    """Redacta la respuesta a una pregunta por marcas a partir del recuento por marca de todos los videos filtrados.
+
+    brand_counts es una lista de {"_id": marca, "videos": n}; los videos sin patrocinadores llegan con _id None.
+    """
+    scope_text = _scope_text(plan)
+    if not brand_counts:
+        return f"No encontré videos {scope_text}".strip() + "."
+
+    counts = sorted(((entry["_id"], entry["videos"]) for entry in brand_counts if entry["_id"]), key=lambda item: -item[1])
+    if not counts:
+        return f"No encontré patrocinadores {scope_text}".strip() + "."
+
+    lines = [f"- {brand} ({count} video{'s' if count > 1 else ''})" for brand, count in counts]
+    return f"Marcas patrocinadoras {scope_text}:\n".replace(" :", ":") + "\n".join(lines)
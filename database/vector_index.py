@@ -0,0 +1,211 @@
+import logging
+import os
+from datetime import datetime, timedelta
+import numpy as np
+from database.embedding_codec import EMBEDDING_PROJECTION, decode_embedding, has_embedding_filter
+
+# Backend del índice vectorial (configurable desde .env)
+VECTOR_INDEX_BACKEND = os.getenv("VECTOR_INDEX_BACKEND", "brute_force")
+# Margen que se vuelve a leer en cada actualización (relojes de otros procesos y escrituras aún en curso)
+VECTOR_INDEX_REFRESH_OVERLAP_SECONDS = int(os.getenv("VECTOR_INDEX_REFRESH_OVERLAP_SECONDS", "60"))
+
+logger = logging.getLogger(__name__)
+
+def normalize_rows(vectors):
+    """Convierte a float32 contiguo y normaliza cada fila a norma 1 (las filas nulas quedan a cero)."""
+    matrix = np.ascontiguousarray(np.atleast_2d(np.asarray(vectors, dtype=np.float32)))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+class BruteForceBackend:
+    """Índice exacto: matriz float32 contigua y pre-normalizada; top-k con un único producto matriz-vector."""
+
+    dtype = np.float32
+
+    def __init__(self, initial_capacity=1024):
+        self._matrix = None
+        self._size = 0
+        self._initial_capacity = initial_capacity
+        self.ids = []
+        self._rows = {}
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, item_id):
+        return item_id in self._rows
+
+    def _ensure_capacity(self, dim, extra):
+        """Reserva espacio con crecimiento amortizado para evitar copias en cada inserción."""
+        if self._matrix is None:
+            self._matrix = np.zeros((max(self._initial_capacity, extra), dim), dtype=self.dtype)
+            return
+
+        if self._matrix.shape[1] != dim:
+            raise ValueError(f"Dimensión {dim} incompatible con el índice ({self._matrix.shape[1]})")
+
+        needed = self._size + extra
+        if needed > self._matrix.shape[0]:
+            new_matrix = np.zeros((max(needed, self._matrix.shape[0] * 2), dim), dtype=self.dtype)
+            new_matrix[:self._size] = self._matrix[:self._size]
+            self._matrix = new_matrix
+
+    def _encode_rows(self, normalized):
+        """Convierte filas normalizadas al formato de almacenamiento del backend."""
+        return normalized
+
+    def _scores(self, matrix, query):
+        """Similitud de coseno entre las filas almacenadas y la consulta normalizada."""
+        return matrix @ query
+
+    def add(self, ids, vectors):
+        """Añade (o reemplaza) vectores identificados por ids."""
+        if len(ids) == 0:
+            return
+        encoded = self._encode_rows(normalize_rows(vectors))
+        self._ensure_capacity(encoded.shape[1], len(ids))
+
+        for item_id, vector in zip(ids, encoded):
+            row = self._rows.get(item_id)
+            if row is None:
+                row = self._size
+                self._rows[item_id] = row
+                self.ids.append(item_id)
+                self._size += 1
+            self._matrix[row] = vector
+
+    def search(self, query, k, candidate_ids=None):
+        """Devuelve los k ids más similares a la consulta como lista de (id, similitud) ordenada."""
+        if self._size == 0 or k <= 0:
+            return []
+
+        query = normalize_rows(query)[0]
+
+        if candidate_ids is None:
+            rows = None
+            scores = self._scores(self._matrix[:self._size], query)
+        else:
+            rows = np.fromiter((self._rows[i] for i in candidate_ids if i in self._rows), dtype=np.int64)
+            if rows.size == 0:
+                return []
+            scores = self._scores(self._matrix[rows], query)
+
+        k = min(k, scores.shape[0])
+        top = np.argpartition(-scores, k - 1)[:k] if k < scores.shape[0] else np.arange(scores.shape[0])
+        top = top[np.argsort(-scores[top])]
+
+        if rows is not None:
+            return [(self.ids[rows[i]], float(scores[i])) for i in top]
+        return [(self.ids[i], float(scores[i])) for i in top]
+
+class Int8Backend(BruteForceBackend):
+    """Como BruteForceBackend, pero con las filas cuantizadas a int8 (4 veces menos memoria).
+
+    Las similitudes son aproximadas (error del orden de 1e-2), suficiente para ordenar el top-k.
+    """
+
+    dtype = np.int8
+    SCALE = 127  # Filas de norma 1: cada componente está en [-1, 1]
+    CHUNK_ROWS = 65536  # Se convierte a float32 por bloques para no duplicar la matriz en memoria
+
+    def _encode_rows(self, normalized):
+        return np.clip(np.round(normalized * self.SCALE), -self.SCALE, self.SCALE).astype(np.int8)
+
+    def _scores(self, matrix, query):
+        scores = np.empty(matrix.shape[0], dtype=np.float32)
+        for start in range(0, matrix.shape[0], self.CHUNK_ROWS):
+            block = matrix[start:start + self.CHUNK_ROWS].astype(np.float32)
+            scores[start:start + self.CHUNK_ROWS] = block @ query
+        return scores / self.SCALE
+
+# Registro de backends disponibles; un índice ANN puede registrarse aquí para catálogos grandes
+BACKENDS = {
+    "brute_force": BruteForceBackend,
+    "int8": Int8Backend,
+}
+
+def register_backend(name, backend_class):
+    """Registra un backend alternativo (debe implementar add, search, __len__ y __contains__)."""
+    BACKENDS[name] = backend_class
+
+_index = None
+_loaded = False
+_ingested_since = None  # Marca de agua: los documentos con ingested_at anterior ya están en el índice
+
+def get_vector_index():
+    """Devuelve el índice vectorial compartido, creándolo con el backend configurado."""
+    global _index
+    if _index is None:
+        _index = BACKENDS[VECTOR_INDEX_BACKEND]()
+    return _index
+
+def is_vector_index_loaded():
+    return _loaded
+
+def _next_watermark():
+    return datetime.utcnow() - timedelta(seconds=VECTOR_INDEX_REFRESH_OVERLAP_SECONDS)
+
+async def load_vector_index(collection, batch_size=1000):
+    """Carga en el índice todos los embeddings guardados en MongoDB (en cualquier formato de almacenamiento)."""
+    global _loaded, _ingested_since
+    index = get_vector_index()
+    ids, vectors = [], []
+    watermark = _next_watermark()
+
+    cursor = collection.find(has_embedding_filter(), {"video_id": 1, "_id": 0, **EMBEDDING_PROJECTION})
+    async for video in cursor:
+        vector = decode_embedding(video)
+        if vector is None:
+            continue
+        ids.append(video["video_id"])
+        vectors.append(vector)
+        if len(ids) >= batch_size:
+            index.add(ids, vectors)
+            ids, vectors = [], []
+
+    if ids:
+        index.add(ids, vectors)
+
+    _loaded = True
+    _ingested_since = watermark
+    logger.info("✅ Índice vectorial cargado con %d videos.", len(index))
+    return index
+
+async def refresh_vector_index(collection, batch_size=1000):
+    """Añade al índice ya cargado los videos guardados por otros procesos (p. ej. la ingesta masiva).
+
+    Solo consulta los documentos con ingested_at posterior a la marca de agua de la carga o actualización
+    anterior (menos VECTOR_INDEX_REFRESH_OVERLAP_SECONDS); los guardados sin ingested_at por versiones
+    anteriores solo se incorporan con load_vector_index. Primero lee los video_id y después los embeddings
+    de los que faltan. Devuelve los documentos añadidos (video_id y channel_name).
+    """
+    global _ingested_since
+    index = get_vector_index()
+    watermark = _next_watermark()
+    query = has_embedding_filter()
+    if _ingested_since is not None:
+        query = {**query, "ingested_at": {"$gte": _ingested_since}}
+    cursor = collection.find(query, {"video_id": 1, "_id": 0})
+    missing = [video["video_id"] async for video in cursor if video["video_id"] not in index]
+
+    added = []
+    for start in range(0, len(missing), batch_size):
+        batch = missing[start:start + batch_size]
+        ids, vectors = [], []
+        cursor = collection.find({"video_id": {"$in": batch}},
+                                 {"video_id": 1, "channel_name": 1, "_id": 0, **EMBEDDING_PROJECTION})
+        async for video in cursor:
+            vector = decode_embedding(video)
+            if vector is None:
+                continue
+            ids.append(video["video_id"])
+            vectors.append(vector)
+            added.append({"video_id": video["video_id"], "channel_name": video.get("channel_name")})
+        if ids:
+            index.add(ids, vectors)
+
+    _ingested_since = watermark
+    if added:
+        logger.info("🔄 Índice vectorial actualizado con %d videos nuevos (%d en total).", len(added), len(index))
+    return added
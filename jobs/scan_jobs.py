@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime
+from database.mongodb import create_scan_job, get_scan_job, get_unfinished_scan_jobs, get_watchlist, update_scan_job
+from pipeline.channel_pipeline import process_channel
+
+logger = logging.getLogger(__name__)
+
+# Configuración de los trabajos de escaneo (desde .env)
+SCAN_WORKERS = int(os.getenv("SCAN_WORKERS", "4"))
+SCAN_QUEUE_SIZE = int(os.getenv("SCAN_QUEUE_SIZE", "1000"))
+SCAN_SCHEDULE_INTERVAL_SECONDS = int(os.getenv("SCAN_SCHEDULE_INTERVAL_SECONDS", "0"))  # 0 = desactivado
+WATCHLIST_CHANNELS = [handle.strip() for handle in os.getenv("WATCHLIST_CHANNELS", "").split(",") if handle.strip()]
+
+def normalize_handle(handle):
+    """Normaliza un handle para deduplicar envíos del mismo canal (@Canal == canal)."""
+    handle = handle.strip()
+    return (handle if handle.startswith("@") else f"@{handle}").lower()
+
+class ScanJobManager:
+    """Cola de trabajos de escaneo con un pool acotado de workers y progreso persistido en MongoDB."""
+
+    def __init__(self, workers=SCAN_WORKERS, schedule_interval=SCAN_SCHEDULE_INTERVAL_SECONDS):
+        self.workers = workers
+        self.schedule_interval = schedule_interval
+        self._queue = asyncio.Queue(maxsize=SCAN_QUEUE_SIZE)
+        self._active = {}  # handle normalizado -> job_id en cola o en ejecución
+        self._creating = {}  # job_id -> trabajo aún no guardado en MongoDB
+        self._tasks = []
+
+    async def start(self):
+        """Arranca los workers, re-encola los trabajos interrumpidos y, si procede, el planificador."""
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+        # Con los workers ya en marcha, put() espera a que haya hueco si quedan más trabajos que SCAN_QUEUE_SIZE
+        for job in await get_unfinished_scan_jobs():
+            key = normalize_handle(job["handle"])
+            if self._active.get(key) == job["_id"]:
+                continue  # Enviado mientras arrancaba el servidor: ya está en la cola
+            if key in self._active:
+                await update_scan_job(job["_id"], {"status": "failed", "error": "Duplicado tras reinicio"})
+                continue
+            self._active[key] = job["_id"]
+            await update_scan_job(job["_id"], {"status": "queued"})
+            await self._queue.put(job["_id"])
+
+        if self.schedule_interval > 0:
+            self._tasks.append(asyncio.create_task(self._scheduler()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, handle, incremental=False, scheduled=False):
+        """Encola un escaneo y devuelve el trabajo; si el canal ya tiene uno pendiente, devuelve ese."""
+        key = normalize_handle(handle)
+        while key in self._active:
+            active_job_id = self._active[key]
+            job = self._creating.get(active_job_id) or await get_scan_job(active_job_id)
+            if job:
+                return job
+            if self._active.get(key) == active_job_id:
+                del self._active[key]  # El trabajo ya no existe en MongoDB: se crea otro
+
+        if self._queue.full():
+            raise asyncio.QueueFull("La cola de escaneos está llena")
+
+        job = {
+            "_id": uuid.uuid4().hex,
+            "handle": handle,
+            "incremental": incremental,
+            "scheduled": scheduled,
+            "status": "queued",
+            "progress": {},
+            "result": None,
+            "error": None,
+            "created_at": datetime.utcnow(),
+            "started_at": None,
+            "finished_at": None
+        }
+        # Reservar el canal antes del primer await, para que los envíos simultáneos reciban este mismo trabajo
+        self._active[key] = job["_id"]
+        self._creating[job["_id"]] = job
+        try:
+            await create_scan_job(job)
+        except Exception:
+            self._active.pop(key, None)
+            raise
+        finally:
+            self._creating.pop(job["_id"], None)
+
+        try:
+            self._queue.put_nowait(job["_id"])
+        except asyncio.QueueFull:
+            self._active.pop(key, None)
+            await update_scan_job(job["_id"], {"status": "failed", "error": "Cola de escaneos llena",
+                                               "finished_at": datetime.utcnow()})
+            raise
+        return job
+
+    async def get(self, job_id):
+        return await get_scan_job(job_id)
+
+    async def _run_job(self, job_id):
+        job = await get_scan_job(job_id)
+        if job is None:
+            return
+
+        await update_scan_job(job_id, {"status": "running", "started_at": datetime.utcnow()})
+
+        async def report_progress(progress):
+            await update_scan_job(job_id, {"progress": progress})
+
+        try:
+            result = await process_channel(job["handle"], max_results=50, incremental=job["incremental"],
+                                           progress=report_progress)
+            status = "failed" if "error" in result else "done"
+            await update_scan_job(job_id, {"status": status, "result": result, "error": result.get("error"),
+                                           "finished_at": datetime.utcnow()})
+        except Exception as e:
+            logger.exception("❌ Error en el trabajo %s (%s): %s", job_id, job["handle"], e)
+            await update_scan_job(job_id, {"status": "failed", "error": str(e), "finished_at": datetime.utcnow()})
+        finally:
+            self._active.pop(normalize_handle(job["handle"]), None)
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run_job(job_id)
+            except Exception as e:
+                logger.exception("❌ Error inesperado en el worker de escaneo: %s", e)
+            finally:
+                self._queue.task_done()
+
+    async def _scheduler(self):
+        """Re-sincroniza periódicamente (en modo incremental) los canales de la lista de seguimiento."""
+        while True:
+            try:
+                handles = list(dict.fromkeys(WATCHLIST_CHANNELS + await get_watchlist()))
+                for handle in handles:
+                    await self.submit(handle, incremental=True, scheduled=True)
+                logger.info("🕒 Re-sincronización programada de %d canales.", len(handles))
+            except Exception as e:
+                logger.exception("❌ Error en la re-sincronización programada: %s", e)
+            await asyncio.sleep(self.schedule_interval)
+
+_manager = None
+
+def get_scan_job_manager():
+    """Devuelve el gestor de trabajos compartido."""
+    global _manager
+    if _manager is None:
+        _manager = ScanJobManager()
+    return _manager
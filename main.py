@@ -1,24 +1,19 @@
-from youtube.youtube_api import *
-from artificial_intelligence.detect_sponsors import detect_sponsors_openai
-from database.mongodb import save_to_mongodb
+import asyncio
+from pipeline.channel_pipeline import process_channel
+from network.http_client import close_http_client
+from database.mongodb import close_database, init_database
+from monitoring.logs import configure_logging
 
 # Configuración
 youtube_handle = "@LolaLoliitaaa" #"@ItzNandez"
-channel_id, channel_name = get_channel_id_and_name(GOOGLE_API_KEY, youtube_handle)
 
-if channel_id:
-    latest_videos = get_latest_non_short_videos(GOOGLE_API_KEY, channel_id, max_results=20)
+configure_logging()
 
-    for video in latest_videos:
-        description = get_video_description(GOOGLE_API_KEY, video["videoId"])
-        print(description)
-        sponsors = detect_sponsors_openai(description) if description else []
-        print(sponsors)
-        save_to_mongodb(
-                video_id=video["videoId"],
-                channel_name=channel_name,
-                channel_id=channel_id,
-                published_at=video["publishTime"],
-                sponsors=sponsors,
-                title=video["title"]
-            )
\ No newline at end of file
+async def main():
+    init_database()
+    result = await process_channel(youtube_handle, max_results=20)
+    print(result)
+    await close_http_client()
+    close_database()
+
+asyncio.run(main())
@@ -0,0 +1,57 @@
+"""Configuración del logging de la aplicación: niveles y salida en texto o JSON (una línea por evento)."""
+import json
+import logging
+import os
+
+# Configuración del logging (desde .env)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # "text" o "json"
+
+# Atributos estándar de LogRecord; el resto llega por extra={...} y se emite como campos estructurados
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+def _extra_fields(record):
+    return {key: value for key, value in vars(record).items() if key not in _RESERVED}
+
+class JsonFormatter(logging.Formatter):
+    """Un objeto JSON por línea con nivel, logger, mensaje y los campos pasados en extra."""
+
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **_extra_fields(record)
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class TextFormatter(logging.Formatter):
+    """Formato legible con los campos de extra añadidos como clave=valor."""
+
+    def format(self, record):
+        line = super().format(record)
+        fields = _extra_fields(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+_configured = False
+
+def configure_logging(level=None, log_format=None):
+    """Configura el logger raíz una sola vez (los módulos usan logging.getLogger(__name__))."""
+    global _configured
+    if _configured:
+        return
+    handler = logging.StreamHandler()
+    if (log_format or LOG_FORMAT) == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(TextFormatter("%(asctime)s %(levelname)s %(name)s: %(message)s", "%H:%M:%S"))
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(level or LOG_LEVEL)
+    logging.getLogger("httpx").setLevel(logging.WARNING)  # Una línea por petición: ya está en /metrics
+    _configured = True
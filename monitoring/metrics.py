@@ -0,0 +1,219 @@
+"""Métricas en memoria (contadores e histogramas) de las llamadas salientes, en formato de texto de Prometheus."""
+import bisect
+import threading
+import time
+from contextlib import asynccontextmanager
+from pymongo import monitoring
+
+# Límites de los histogramas de latencia (segundos)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Cuota de la YouTube Data API por endpoint (unidades por llamada; por defecto 10.000 unidades/día)
+YOUTUBE_QUOTA_COST = {"search": 100, "videos": 1, "channels": 1, "playlistItems": 1}
+
+# Precio en USD por millón de tokens (entrada, salida); revisar cuando OpenAI cambie sus tarifas
+OPENAI_PRICES_PER_MILLION = {
+    "text-embedding-3-small": (0.02, 0.0),
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "gpt-4o-mini-realtime-preview": (0.60, 2.40),
+}
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labelnames, labels, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labels)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    """Contador acumulado por combinación de etiquetas."""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()  # Los eventos de pymongo llegan desde hilos de Motor
+
+    def inc(self, *labels, amount=1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0.0)
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {value:g}" for labels, value in items]
+
+class Histogram:
+    """Histograma acumulativo por combinación de etiquetas (buckets, suma y número de observaciones)."""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # etiquetas -> [conteos por bucket (+Inf al final), suma]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def count(self, *labels):
+        series = self._series.get(labels)
+        return sum(series[0]) if series else 0
+
+    def render(self):
+        with self._lock:
+            items = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._series.items())
+
+        lines = []
+        for labels, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                bucket_labels = _format_labels(self.labelnames, labels, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total:g}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            return self._metrics[metric.name]
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        """Exporta todas las métricas en el formato de texto de Prometheus (versión 0.0.4)."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry()
+
+OUTBOUND_LATENCY = REGISTRY.histogram(
+    "outbound_call_duration_seconds", "Latencia de las llamadas salientes por servicio y operación.",
+    ("service", "operation", "status"))
+OUTBOUND_CALLS = REGISTRY.counter(
+    "outbound_calls_total", "Llamadas salientes por servicio, operación y resultado.",
+    ("service", "operation", "status"))
+YOUTUBE_QUOTA_UNITS = REGISTRY.counter(
+    "youtube_quota_units_total", "Unidades de cuota de la YouTube Data API consumidas.", ("endpoint",))
+OPENAI_TOKENS = REGISTRY.counter(
+    "openai_tokens_total", "Tokens enviados (prompt) y generados (completion) por modelo.", ("model", "type"))
+OPENAI_COST = REGISTRY.counter(
+    "openai_cost_usd_total", "Coste acumulado estimado de OpenAI en USD.", ("model",))
+MONGO_LATENCY = REGISTRY.histogram(
+    "mongo_command_duration_seconds", "Latencia de los comandos de MongoDB.", ("command", "status"))
+HTTP_SERVER_LATENCY = REGISTRY.histogram(
+    "http_server_request_duration_seconds", "Latencia de las peticiones recibidas por el servidor.",
+    ("method", "route", "status"))
+
+def observe_call(service, operation, status, seconds):
+    """Registra una llamada saliente ya medida."""
+    OUTBOUND_LATENCY.observe(seconds, service, operation, status)
+    OUTBOUND_CALLS.inc(service, operation, status)
+
+@asynccontextmanager
+async def track_call(service, operation):
+    """Mide la latencia de una llamada saliente y la registra como "ok" o "error" según si lanza excepción."""
+    start = time.perf_counter()
+    status = "error"
+    try:
+        yield
+        status = "ok"
+    finally:
+        observe_call(service, operation, status, time.perf_counter() - start)
+
+def record_youtube_quota(endpoint):
+    YOUTUBE_QUOTA_UNITS.inc(endpoint, amount=YOUTUBE_QUOTA_COST.get(endpoint, 1))
+
+def openai_cost(model, prompt_tokens, completion_tokens=0):
+    """Coste estimado en USD de una llamada (0 si el modelo no está en la tabla de precios)."""
+    input_price, output_price = OPENAI_PRICES_PER_MILLION.get(model, (0.0, 0.0))
+    return (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+
+def record_openai_usage(model, prompt_tokens, completion_tokens=0):
+    """Acumula los tokens y el coste de una llamada a OpenAI."""
+    OPENAI_TOKENS.inc(model, "prompt", amount=prompt_tokens)
+    if completion_tokens:
+        OPENAI_TOKENS.inc(model, "completion", amount=completion_tokens)
+    OPENAI_COST.inc(model, amount=openai_cost(model, prompt_tokens, completion_tokens))
+
+def record_openai_response(model, response):
+    """Acumula el uso que informa una respuesta de OpenAI (si trae el campo usage)."""
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        record_openai_usage(model, usage.prompt_tokens or 0, getattr(usage, "completion_tokens", 0) or 0)
+
+class RequestMetricsMiddleware:
+    """Middleware ASGI que registra la latencia de cada petición por ruta (la plantilla, no la URL) y estado.
+
+    Es ASGI puro (no BaseHTTPMiddleware) para no añadir una tarea extra por petición ni retrasar los streams.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = ["500"]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = str(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")  # El router de Starlette la añade al scope al resolver la ruta
+            HTTP_SERVER_LATENCY.observe(time.perf_counter() - start, scope["method"],
+                                        route.path if route else "unmatched", status[0])
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Listener de pymongo que registra la latencia de cada comando enviado a MongoDB."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_LATENCY.observe(event.duration_micros / 1e6, event.command_name, "ok")
+
+    def failed(self, event):
+        MONGO_LATENCY.observe(event.duration_micros / 1e6, event.command_name, "error")
+
+def render_metrics():
+    return REGISTRY.render()
@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from urllib.parse import urlsplit
+from monitoring.metrics import observe_call, record_youtube_quota
+
+logger = logging.getLogger(__name__)
+
+# Configuración del cliente HTTP compartido (pool de conexiones keep-alive)
+HTTP_TIMEOUT_SECONDS = float(os.getenv("HTTP_TIMEOUT_SECONDS", "10"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+HTTP_BACKOFF_BASE_SECONDS = float(os.getenv("HTTP_BACKOFF_BASE_SECONDS", "0.5"))
+HTTP_BACKOFF_MAX_SECONDS = float(os.getenv("HTTP_BACKOFF_MAX_SECONDS", "8"))
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+# Nombre del servicio en las métricas según el host de destino
+SERVICE_BY_HOST = {"www.googleapis.com": "youtube", "graph.facebook.com": "whatsapp"}
+
+_client = None
+
+def get_http_client():
+    """Devuelve el cliente HTTP asíncrono compartido, creándolo la primera vez."""
+    global _client
+    if _client is None or _client.is_closed:
+        import httpx  # Diferido: ~0.1 s de importación que no hace falta hasta la primera petición saliente
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(HTTP_TIMEOUT_SECONDS),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS
+            )
+        )
+    return _client
+
+def set_http_client(client):
+    """Reemplaza el cliente compartido (útil para apuntar a servidores falsos locales)."""
+    global _client
+    _client = client
+
+async def close_http_client():
+    """Cierra el cliente compartido y libera las conexiones del pool."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+def _retry_delay(attempt, response=None):
+    """Calcula la espera antes del siguiente intento respetando Retry-After si existe."""
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), HTTP_BACKOFF_MAX_SECONDS)
+
+    delay = HTTP_BACKOFF_BASE_SECONDS * (2 ** attempt)
+    return min(delay, HTTP_BACKOFF_MAX_SECONDS) * random.uniform(0.5, 1.0)  # Jitter
+
+def _call_labels(url):
+    """(servicio, operación) de una URL para las métricas: p. ej. ("youtube", "videos")."""
+    parsed = urlsplit(url)
+    return SERVICE_BY_HOST.get(parsed.hostname, parsed.hostname), parsed.path.rstrip("/").rsplit("/", 1)[-1]
+
+async def request_with_retry(method, url, max_retries=HTTP_MAX_RETRIES, idempotent=None, before_attempt=None, **kwargs):
+    """Ejecuta una petición HTTP con reintentos y backoff exponencial ante 429/5xx y errores de red.
+
+    Las peticiones no idempotentes (por defecto, POST y PATCH) solo se reintentan si no llegaron a enviarse
+    (error de conexión) o ante un 429: tras un timeout de lectura o un 5xx el servidor pudo haberlas
+    procesado, y repetirlas duplicaría el efecto (p. ej. un mensaje de WhatsApp).
+    Cada intento se registra en las métricas (latencia por servicio y operación y, en YouTube, cuota consumida)
+    y, si se pasa before_attempt, se llama antes de cada uno (p. ej. para descontar cuota; puede lanzar para cortar).
+    """
+    client = get_http_client()
+    import httpx  # Ya cargado por get_http_client
+    service, operation = _call_labels(url)
+    if idempotent is None:
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+    if idempotent:
+        retry_errors, retry_statuses = (httpx.TimeoutException, httpx.NetworkError), RETRY_STATUS_CODES
+    else:
+        retry_errors, retry_statuses = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout), {429}
+
+    for attempt in range(max_retries + 1):
+        if before_attempt is not None:
+            before_attempt()
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except (httpx.TimeoutException, httpx.NetworkError) as e:
+            observe_call(service, operation, "network_error", time.perf_counter() - start)
+            if attempt == max_retries or not isinstance(e, retry_errors):
+                raise
+            logger.warning("⚠️ Error de red en %s %s/%s: %s. Reintentando...", method, service, operation, e)
+            await asyncio.sleep(_retry_delay(attempt))
+            continue
+
+        observe_call(service, operation, str(response.status_code), time.perf_counter() - start)
+        if service == "youtube":
+            record_youtube_quota(operation)  # YouTube cobra cuota también por las peticiones fallidas
+
+        if response.status_code not in retry_statuses or attempt == max_retries:
+            return response
+
+        logger.warning("⚠️ %s %s/%s devolvió %s. Reintentando...", method, service, operation, response.status_code)
+        await asyncio.sleep(_retry_delay(attempt, response))
+
+    return response
+
+async def http_get(url, **kwargs):
+    """GET asíncrono con reintentos."""
+    return await request_with_retry("GET", url, **kwargs)
+
+async def http_post(url, **kwargs):
+    """POST asíncrono con reintentos (solo los seguros para peticiones no idempotentes)."""
+    return await request_with_retry("POST", url, **kwargs)
@@ -0,0 +1,24 @@
+import asyncio
+import time
+
+class AsyncRateLimiter:
+    """Limitador de tipo token bucket: como máximo `rate` adquisiciones por `period` segundos, con ráfagas de hasta `burst`."""
+
+    def __init__(self, rate, period=60.0, burst=None):
+        self.fill_rate = rate / period
+        self.capacity = float(burst if burst is not None else max(1.0, min(rate, self.fill_rate * 5)))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Espera hasta que haya un token disponible y lo consume."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.fill_rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.fill_rate)
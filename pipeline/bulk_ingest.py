@@ -0,0 +1,236 @@
+"""Ingesta masiva de canales desde un fichero de handles o IDs, repartida entre varios procesos y reanudable.
+
+Uso:
+    python -m pipeline.bulk_ingest --input canales.txt
+    python -m pipeline.bulk_ingest --input canales.txt --workers 8 --concurrency 4 --quota-budget 9000 --openai-rpm 3000
+    python -m pipeline.bulk_ingest --input canales.txt --checkpoint ingesta.jsonl  # Reanuda donde se quedó
+
+El fichero tiene un canal por línea (@handle o ID UC...); se ignoran las líneas vacías y las que empiezan por #.
+Los IDs se resuelven en lotes de 50 con channels.list (1 unidad por lote); los handles necesitan una llamada
+cada uno porque forHandle solo admite un valor.
+
+Cada canal terminado se anota en el checkpoint (JSONL). Al relanzar se saltan los que terminaron ("done" o
+"not_found") y se reintentan los fallidos o sin cuota; dentro de un canal, la marca de agua y la comprobación
+de videos existentes evitan reprocesar lo que ya se guardó.
+
+Los workers no cargan el índice vectorial: un servidor en marcha incorpora los videos nuevos con
+POST /index/refresh (o cada VECTOR_INDEX_REFRESH_SECONDS segundos), sin necesidad de reiniciarlo.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import re
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from artificial_intelligence.detect_sponsors import set_openai_rate_limiter
+from database.mongodb import close_database, init_database
+from monitoring.logs import configure_logging
+from network.http_client import close_http_client
+from network.rate_limit import AsyncRateLimiter
+from pipeline.channel_pipeline import GOOGLE_API_KEY, process_resolved_channel
+from youtube.quota import QuotaBudget, QuotaExceeded, get_quota_budget, set_quota_budget
+from youtube.youtube_api import get_channel_id_and_name, get_channels_by_ids
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_ID_PATTERN = re.compile(r"^UC[\w-]{22}$")
+FINAL_STATUSES = {"done", "not_found"}  # Estados que no se reintentan al reanudar
+MIN_CHANNEL_QUOTA = 2  # Unidades mínimas de una sincronización (una página de playlistItems + videos.list)
+DEFAULT_QUOTA_BUDGET = 9000  # Margen sobre las 10.000 unidades diarias por defecto
+
+def read_inputs(path):
+    """Handles o IDs del fichero, sin duplicados y en orden."""
+    with open(path, encoding="utf-8") as file:
+        lines = (line.strip() for line in file)
+        return list(dict.fromkeys(line for line in lines if line and not line.startswith("#")))
+
+def load_checkpoint(path):
+    """Último estado registrado de cada entrada del fichero ({entrada: registro})."""
+    entries = {}
+    try:
+        with open(path, encoding="utf-8") as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Línea cortada por una interrupción
+                entries[entry["input"]] = entry
+    except FileNotFoundError:
+        pass
+    return entries
+
+class CheckpointWriter:
+    """Añade un registro JSON por línea; cada línea se escribe de una vez para que varios procesos compartan el fichero."""
+
+    def __init__(self, path):
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, entry):
+        self._file.write(json.dumps({**entry, "finished_at": datetime.utcnow().isoformat()}, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+async def resolve_channels(inputs, concurrency=10):
+    """Resuelve handles e IDs a (channel_id, nombre). Devuelve (resueltos, registros de los no resueltos)."""
+    ids = [value for value in inputs if CHANNEL_ID_PATTERN.match(value)]
+    handles = [value for value in inputs if not CHANNEL_ID_PATTERN.match(value)]
+    resolved, unresolved = [], []
+
+    try:
+        names = await get_channels_by_ids(GOOGLE_API_KEY, ids)
+    except QuotaExceeded as e:
+        names = {}
+        unresolved.extend({"input": value, "status": "quota", "error": str(e)} for value in ids)
+        ids = []
+    for channel_id in ids:
+        if channel_id in names:
+            resolved.append({"input": channel_id, "channel_id": channel_id, "channel_name": names[channel_id]})
+        else:
+            unresolved.append({"input": channel_id, "status": "not_found"})
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def resolve_handle(handle):
+        async with semaphore:
+            try:
+                channel_id, channel_name = await get_channel_id_and_name(GOOGLE_API_KEY, handle)
+            except QuotaExceeded as e:
+                return {"input": handle, "status": "quota", "error": str(e)}
+            except Exception as e:
+                return {"input": handle, "status": "failed", "error": str(e)}
+        if not channel_id:
+            return {"input": handle, "status": "not_found"}
+        return {"input": handle, "channel_id": channel_id, "channel_name": channel_name}
+
+    for result in await asyncio.gather(*(resolve_handle(handle) for handle in handles)):
+        (resolved if "channel_id" in result and "status" not in result else unresolved).append(result)
+    return resolved, unresolved
+
+async def ingest_channel(channel, max_videos):
+    """Sincroniza un canal ya resuelto y devuelve su registro para el checkpoint."""
+    entry = {"input": channel["input"], "channel_id": channel["channel_id"], "channel_name": channel["channel_name"]}
+    budget = get_quota_budget()
+    if budget is not None and budget.remaining() < MIN_CHANNEL_QUOTA:
+        return {**entry, "status": "quota", "error": "Cuota de YouTube agotada"}
+
+    try:
+        result = await process_resolved_channel(channel["channel_id"], channel["channel_name"],
+                                                max_results=max_videos, incremental=True)
+    except QuotaExceeded as e:
+        return {**entry, "status": "quota", "error": str(e)}
+    except Exception as e:
+        logger.exception("❌ Error ingiriendo %s: %s", channel["input"], e)
+        return {**entry, "status": "failed", "error": str(e)}
+
+    if "error" in result:
+        return {**entry, "status": "failed", "error": result["error"]}
+    entry["videos"] = len(result.get("videos", []))
+    if result.get("errors"):
+        # La marca de agua no avanzó: al reanudar se reintentan solo los videos que fallaron
+        return {**entry, "status": "failed", "error": f"{len(result['errors'])} videos con errores"}
+    return {**entry, "status": "done"}
+
+async def _ingest_shard(channels, checkpoint_path, concurrency, max_videos):
+    semaphore = asyncio.Semaphore(concurrency)
+    checkpoint = CheckpointWriter(checkpoint_path)
+    statuses = Counter()
+
+    async def run(channel):
+        async with semaphore:
+            entry = await ingest_channel(channel, max_videos)
+        checkpoint.write(entry)
+        statuses[entry["status"]] += 1
+        statuses["videos"] += entry.get("videos", 0)
+        logger.info("📺 %s: %s (%d videos)", channel["input"], entry["status"], entry.get("videos", 0))
+
+    init_database()
+    try:
+        await asyncio.gather(*(run(channel) for channel in channels))
+    finally:
+        checkpoint.close()
+        await close_http_client()
+        close_database()
+    return dict(statuses)
+
+def ingest_shard(channels, checkpoint_path, concurrency, max_videos):
+    """Punto de entrada de cada proceso: ingiere su parte de los canales en su propio bucle de eventos."""
+    return asyncio.run(_ingest_shard(channels, checkpoint_path, concurrency, max_videos))
+
+def _init_worker(quota_limit, quota_counter, openai_rpm):
+    """Configura cada proceso con el presupuesto de cuota compartido y su parte del límite de OpenAI."""
+    configure_logging()
+    set_quota_budget(QuotaBudget(quota_limit, quota_counter))
+    if openai_rpm:
+        set_openai_rate_limiter(AsyncRateLimiter(openai_rpm))
+
+def run(args):
+    started = time.perf_counter()
+    inputs = read_inputs(args.input)
+    done = {value for value, entry in load_checkpoint(args.checkpoint).items() if entry["status"] in FINAL_STATUSES}
+    pending = [value for value in inputs if value not in done]
+    logger.info("📋 %d canales en el fichero, %d ya terminados, %d pendientes.", len(inputs), len(done), len(pending))
+
+    context = multiprocessing.get_context("spawn")  # Procesos limpios: cada uno crea sus clientes de Motor y HTTP
+    budget = QuotaBudget(args.quota_budget, context.Value("q", 0))
+    set_quota_budget(budget)
+
+    async def resolve():
+        try:
+            return await resolve_channels(pending, args.concurrency * args.workers)
+        finally:
+            await close_http_client()
+
+    resolved, unresolved = asyncio.run(resolve())
+    checkpoint = CheckpointWriter(args.checkpoint)
+    for entry in unresolved:
+        checkpoint.write(entry)
+    checkpoint.close()
+
+    statuses = Counter(entry["status"] for entry in unresolved)
+    shards = [resolved[i::args.workers] for i in range(args.workers)]
+    shards = [shard for shard in shards if shard]
+    openai_rpm = args.openai_rpm / len(shards) if args.openai_rpm and shards else 0
+
+    if len(shards) <= 1:
+        _init_worker(args.quota_budget, budget.counter, openai_rpm)
+        results = [ingest_shard(shard, args.checkpoint, args.concurrency, args.max_videos) for shard in shards]
+    else:
+        with ProcessPoolExecutor(max_workers=len(shards), mp_context=context, initializer=_init_worker,
+                                 initargs=(args.quota_budget, budget.counter, openai_rpm)) as pool:
+            futures = [pool.submit(ingest_shard, shard, args.checkpoint, args.concurrency, args.max_videos)
+                       for shard in shards]
+            results = [future.result() for future in futures]
+
+    for result in results:
+        statuses.update(result)
+    videos = statuses.pop("videos", 0)
+    logger.info("✅ Ingesta terminada en %.1fs: %s, %d videos nuevos, %d/%d unidades de cuota.",
+                time.perf_counter() - started, dict(statuses), videos, budget.used, budget.limit)
+    return statuses
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingesta masiva de canales de YouTube con checkpoints.")
+    parser.add_argument("--input", required=True, help="Fichero con un @handle o ID de canal por línea")
+    parser.add_argument("--checkpoint", default="bulk_ingest_checkpoint.jsonl", help="Fichero JSONL de progreso")
+    parser.add_argument("--workers", type=int, default=max(1, min(4, multiprocessing.cpu_count())),
+                        help="Procesos en paralelo")
+    parser.add_argument("--concurrency", type=int, default=4, help="Canales simultáneos por proceso")
+    parser.add_argument("--max-videos", type=int, default=50, help="Videos nuevos como máximo por canal")
+    parser.add_argument("--quota-budget", type=int, default=DEFAULT_QUOTA_BUDGET,
+                        help="Unidades de cuota de YouTube para toda la ejecución (todos los procesos)")
+    parser.add_argument("--openai-rpm", type=float, default=0,
+                        help="Peticiones por minuto a OpenAI entre todos los procesos (0 = sin límite)")
+    args = parser.parse_args()
+
+    configure_logging()
+    statuses = run(args)
+    return 0 if not statuses.get("failed") else 1
+
+if __name__ == "__main__":
+    raise SystemExit(main())
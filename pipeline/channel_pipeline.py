@@ -0,0 +1,230 @@
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+from youtube.youtube_api import get_channel_id_and_name, get_latest_non_short_videos, get_new_uploads
+from artificial_intelligence.answer_cache import get_answer_cache
+from artificial_intelligence.detect_sponsors import detect_sponsors_batch, generate_openai_embeddings
+from artificial_intelligence.sponsor_prefilter import SPONSOR_PREFILTER_ENABLED
+from database.mongodb import build_video_document, bulk_save_to_mongodb, get_channel_watermark, get_existing_video_ids, set_channel_watermark
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+GOOGLE_API_KEY = os.getenv("GOOGLE_API")
+
+# Límites de concurrencia por backend (configurables desde .env)
+CONCURRENCY_LIMITS = {
+    "youtube": int(os.getenv("YOUTUBE_CONCURRENCY", "8")),
+    "openai_chat": int(os.getenv("OPENAI_CHAT_CONCURRENCY", "8")),
+    "openai_embeddings": int(os.getenv("OPENAI_EMBEDDINGS_CONCURRENCY", "16")),
+    "mongo": int(os.getenv("MONGO_CONCURRENCY", "32")),
+}
+
+# Semáforos compartidos entre todas las ejecuciones para acotar la carga real de cada backend
+_semaphores = {}
+
+def get_semaphore(backend):
+    """Devuelve el semáforo global que limita las llamadas concurrentes a un backend."""
+    if backend not in _semaphores:
+        _semaphores[backend] = asyncio.Semaphore(CONCURRENCY_LIMITS[backend])
+    return _semaphores[backend]
+
+class StageTimings:
+    """Acumula tiempos por etapa del pipeline para saber dónde se va el tiempo."""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.stages = {}
+
+    @asynccontextmanager
+    async def measure(self, stage, backend=None):
+        """Mide una etapa; si se indica backend, espera su semáforo (la espera se mide aparte)."""
+        stats = self.stages.setdefault(stage, {"calls": 0, "total_s": 0.0, "max_s": 0.0, "wait_s": 0.0})
+        wait_start = time.perf_counter()
+
+        if backend is None:
+            start = wait_start
+            try:
+                yield
+            finally:
+                self._record(stats, start)
+            return
+
+        async with get_semaphore(backend):
+            start = time.perf_counter()
+            stats["wait_s"] += start - wait_start
+            try:
+                yield
+            finally:
+                self._record(stats, start)
+
+    def _record(self, stats, start):
+        elapsed = time.perf_counter() - start
+        stats["calls"] += 1
+        stats["total_s"] += elapsed
+        stats["max_s"] = max(stats["max_s"], elapsed)
+
+    def summary(self):
+        """Resumen serializable de los tiempos por etapa y del tiempo total."""
+        return {
+            "total_s": round(time.perf_counter() - self.started_at, 3),
+            "stages": {
+                stage: {
+                    "calls": stats["calls"],
+                    "total_s": round(stats["total_s"], 3),
+                    "avg_s": round(stats["total_s"] / stats["calls"], 3) if stats["calls"] else 0.0,
+                    "max_s": round(stats["max_s"], 3),
+                    "wait_s": round(stats["wait_s"], 3),
+                }
+                for stage, stats in self.stages.items()
+            }
+        }
+
+def build_text_to_embed(channel_name, title, sponsors):
+    """Texto que se usa para generar el embedding de un video."""
+    return f"""
+        Canal: {channel_name}
+        Título: {title}
+        Patrocinios: {', '.join(sponsors) if sponsors else 'None'}
+        """
+
+async def _report(progress, stage, **fields):
+    """Notifica el progreso del escaneo si hay alguien escuchando."""
+    if progress is not None:
+        await progress({"stage": stage, **fields})
+
+def _split_results(videos, results, errors):
+    """Separa resultados correctos de excepciones, anotando los errores por video."""
+    ok = []
+    for video, result in zip(videos, results):
+        if isinstance(result, Exception):
+            logger.error("❌ Error procesando el video %s: %s", video["videoId"], result)
+            errors.append({"video_id": video["videoId"], "error": str(result)})
+        elif result is not None:
+            ok.append((video, result))
+    return ok
+
+async def process_videos(videos, channel_id, channel_name, timings, progress=None):
+    """Procesa videos por etapas: existencia y guardado en lote, patrocinadores en paralelo y embeddings en lote."""
+    errors = []
+
+    # Etapa 1: una sola consulta para saber qué videos ya están en MongoDB
+    async with timings.measure("mongo_exists", "mongo"):
+        existing_ids = await get_existing_video_ids([video["videoId"] for video in videos])
+    if existing_ids:
+        logger.info("⚠️ %d videos ya existen en MongoDB. Saltando IA...", len(existing_ids))
+    videos = [video for video in videos if video["videoId"] not in existing_ids]
+    await _report(progress, "sponsors", new_videos=len(videos), existing_videos=len(existing_ids))
+
+    # Etapa 2: patrocinadores de todos los videos juntos: una consulta y una escritura a la caché por escaneo,
+    # y el semáforo de openai_chat tomado por cada llamada al LLM (en modo por párrafos un video genera varias)
+    results = await detect_sponsors_batch([video["description"] for video in videos],
+                                          slot=lambda: timings.measure("sponsors", "openai_chat"))
+    pending = _split_results(videos, results, errors)
+    if not pending:
+        return [], errors
+
+    # Etapa 3: todos los embeddings del canal en el mínimo de peticiones
+    await _report(progress, "embeddings", new_videos=len(pending), errors=len(errors))
+    texts = [build_text_to_embed(channel_name, video["title"], sponsors) for video, sponsors in pending]
+    try:
+        async with timings.measure("embeddings", "openai_embeddings"):
+            embeddings = await generate_openai_embeddings(texts)
+    except Exception as e:
+        logger.error("❌ Error generando embeddings: %s", e)
+        errors.extend({"video_id": video["videoId"], "error": str(e)} for video, _ in pending)
+        return [], errors
+
+    # Etapa 4: guardado de todos los videos en una sola escritura masiva
+    await _report(progress, "saving", new_videos=len(pending), errors=len(errors))
+    documents = [
+        build_video_document(
+            video_id=video["videoId"],
+            channel_name=channel_name,
+            channel_id=channel_id,
+            published_at=video["publishTime"],
+            sponsors=sponsors,
+            title=video["title"],
+            description=video["description"],
+            embedding=embedding,
+            sponsor_prefilter=SPONSOR_PREFILTER_ENABLED
+        )
+        for (video, sponsors), embedding in zip(pending, embeddings)
+    ]
+    try:
+        async with timings.measure("mongo_save", "mongo"):
+            inserted_ids, failures = await bulk_save_to_mongodb(documents)
+        if inserted_ids:
+            get_answer_cache().invalidate_channels([channel_name])  # Las respuestas sobre este canal quedan obsoletas
+    except Exception as e:
+        logger.error("❌ Error guardando en MongoDB: %s", e)
+        errors.extend({"video_id": video["videoId"], "error": str(e)} for video, _ in pending)
+        return [], errors
+
+    # Los que no se escribieron quedan como errores: la marca de agua no avanza y se reintentan
+    errors.extend(failures)
+    failed_ids = {failure["video_id"] for failure in failures}
+    processed_videos = [
+        {
+            "video_id": video["videoId"],
+            "title": video["title"],
+            "published_at": video["publishTime"],
+            "sponsors": sponsors
+        }
+        for video, sponsors in pending
+        if video["videoId"] not in failed_ids
+    ]
+    return processed_videos, errors
+
+async def process_channel(youtube_handle, max_results=50, incremental=False, progress=None):
+    """Obtiene los videos recientes de un canal y los procesa en paralelo con concurrencia acotada.
+
+    En modo incremental se lee la playlist de subidas desde la última marca de agua del canal.
+    Si se pasa progress (corrutina que recibe un dict), se notifica el avance por etapas.
+    """
+    timings = StageTimings()
+    await _report(progress, "channel")
+
+    async with timings.measure("youtube_channel", "youtube"):
+        channel_id, channel_name = await get_channel_id_and_name(GOOGLE_API_KEY, youtube_handle)
+    if not channel_id:
+        return {"error": "No se encontró el canal. Verifica el nombre."}
+
+    return await process_resolved_channel(channel_id, channel_name, max_results, incremental, progress, timings)
+
+async def process_resolved_channel(channel_id, channel_name, max_results=50, incremental=False, progress=None, timings=None):
+    """Como process_channel, pero para un canal ya resuelto (p. ej. en lote con get_channels_by_ids)."""
+    timings = timings or StageTimings()
+    newest = None
+    await _report(progress, "listing", channel=channel_name)
+    async with timings.measure("youtube_videos", "youtube"):
+        if incremental:
+            watermark = await get_channel_watermark(channel_id)
+            latest_videos, newest = await get_new_uploads(GOOGLE_API_KEY, channel_id, watermark, max_results=max_results)
+        else:
+            latest_videos = await get_latest_non_short_videos(GOOGLE_API_KEY, channel_id, max_results=max_results)
+
+    if not latest_videos:
+        if newest:
+            await set_channel_watermark(channel_id, newest["video_id"], newest["published_at"])  # Solo había Shorts
+        return {"message": f"No se encontraron videos recientes de más de 120s en {channel_name}."}
+
+    await _report(progress, "exists", channel=channel_name, videos=len(latest_videos))
+    processed_videos, errors = await process_videos(latest_videos, channel_id, channel_name, timings, progress)
+
+    # Avanzar la marca de agua solo si todo se procesó, para reintentar los fallidos en la próxima sincronización
+    if newest and not errors:
+        await set_channel_watermark(channel_id, newest["video_id"], newest["published_at"])
+
+    response = {
+        "message": "✅ Procesamiento completado",
+        "channel": channel_name,
+        "videos": processed_videos,
+        "timings": timings.summary()
+    }
+    if errors:
+        response["errors"] = errors
+    return response
@@ -1,93 +1,190 @@
+import asyncio
+import json
+import logging
 from fastapi import FastAPI, Request
-import uvicorn
+from fastapi.responses import PlainTextResponse, StreamingResponse
 import os
-import requests
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-from youtube.youtube_api import get_channel_id_and_name, get_latest_non_short_videos, get_video_description
-from artificial_intelligence.detect_sponsors import ask_chatgpt, detect_sponsors_openai, generate_openai_embedding, generate_openai_response, is_relevant_question
-from database.mongodb import find_similar_videos, save_to_mongodb, collection  
+from network.http_client import close_http_client
+from artificial_intelligence.embedding_cache import get_embedding_cache
+from artificial_intelligence.sponsor_cache import get_sponsor_cache
+from artificial_intelligence.answer_cache import cached_openai_response, cached_openai_response_stream, get_answer_cache
+from artificial_intelligence.detect_sponsors import generate_openai_embedding, get_keyword_embeddings, get_openai_client
+from artificial_intelligence.sponsor_prefilter import set_known_brands
+from database.mongodb import add_to_watchlist, answer_structured_query, close_database, ensure_indexes, find_similar_videos, get_known_brands, init_database, load_video_index, plan_user_query, refresh_video_index
+from jobs.scan_jobs import get_scan_job_manager
+from monitoring.logs import configure_logging
+from monitoring.metrics import RequestMetricsMiddleware, render_metrics
+from whatsapp.whatsapp_bot import get_whatsapp_dispatcher
 from pydantic import BaseModel
 
 # Cargar variables de entorno
 load_dotenv()
-GOOGLE_API_KEY = os.getenv("GOOGLE_API")
-WHATSAPP_TOKEN = os.getenv("WHATSAPP_TOKEN")
-WHATSAPP_PHONE_ID = os.getenv("WHATSAPP_PHONE_ID")
+configure_logging()  # Nivel y formato desde LOG_LEVEL y LOG_FORMAT
 VERIFY_TOKEN = os.getenv("VERIFY_TOKEN")  # Token para verificar el webhook
-
-app = FastAPI()
+VECTOR_INDEX_REFRESH_SECONDS = int(os.getenv("VECTOR_INDEX_REFRESH_SECONDS", "0"))  # 0 = solo con POST /index/refresh
+
+logger = logging.getLogger(__name__)
+
+async def _load_known_brands():
+    set_known_brands(await get_known_brands())
+
+async def warm_up():
+    """Precarga en segundo plano lo que necesitan las primeras consultas, sin retrasar el arranque.
+
+    Las peticiones que lleguen antes esperan a la misma carga (el índice y los embeddings de palabras clave
+    tienen su propio lock), así que solo cambia cuándo se paga el coste. Cada paso es independiente: si uno
+    falla, se registra y los demás se ejecutan igualmente.
+    """
+    steps = [
+        ("índices de MongoDB", ensure_indexes),  # Índices de video_id (único) y (channel_id, published_at)
+        ("trabajos de escaneo", get_scan_job_manager().start),  # Workers y trabajos interrumpidos, antes de las cargas largas
+        ("cliente de OpenAI", lambda: asyncio.to_thread(get_openai_client)),  # Importar openai fuera del bucle de eventos
+        ("índice vectorial", load_video_index),  # Cargar embeddings en el índice vectorial
+        ("marcas conocidas", _load_known_brands),  # Ampliar el diccionario del prefiltro de patrocinios
+        ("embeddings de palabras clave", get_keyword_embeddings),  # Para is_relevant_question
+    ]
+    failed = []
+    for name, step in steps:
+        try:
+            await step()
+        except Exception as e:
+            failed.append(name)
+            logger.exception("❌ Error en la precarga (%s): %s", name, e)
+    if failed:
+        logger.warning("⚠️ Precarga completada con errores en: %s.", ", ".join(failed))
+    else:
+        logger.info("🔥 Precarga completada.")
+
+async def refresh_index():
+    """Incorpora al índice vectorial los videos guardados por otros procesos y descarta las respuestas obsoletas."""
+    channels = await refresh_video_index()
+    if channels:
+        get_answer_cache().invalidate_channels(channels)
+    return channels
+
+async def refresh_index_periodically(interval):
+    """Refresca el índice cada `interval` segundos (p. ej. mientras corre la ingesta masiva en otros procesos)."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await refresh_index()
+        except Exception as e:
+            logger.exception("❌ Error refrescando el índice vectorial: %s", e)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Gestiona los recursos compartidos durante la vida del servidor."""
+    init_database()  # Cliente de MongoDB (no se conecta hasta la primera operación)
+    background_tasks = [asyncio.create_task(warm_up())]
+    if VECTOR_INDEX_REFRESH_SECONDS > 0:
+        background_tasks.append(asyncio.create_task(refresh_index_periodically(VECTOR_INDEX_REFRESH_SECONDS)))
+    yield
+    for task in background_tasks:
+        task.cancel()
+    await get_scan_job_manager().stop()
+    await get_whatsapp_dispatcher().stop()
+    await close_http_client()  # Cerrar el pool de conexiones HTTP
+    close_database()
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(RequestMetricsMiddleware)  # Latencia por ruta en /metrics
 
 @app.get("/")
 async def root():
     return {"message": "🚀 FastAPI está funcionando correctamente!"}
 
-@app.get("/procesar/{youtube_handle}")
-async def process_youtube_channel(youtube_handle: str):
-    """Obtiene videos recientes de un canal, detecta patrocinadores y guarda los datos en MongoDB."""
+@app.get("/metrics")
+async def metrics():
+    """Métricas en formato Prometheus: latencias, cuota de YouTube, tokens y coste de OpenAI, comandos de MongoDB."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
-    channel_id, channel_name = get_channel_id_and_name(GOOGLE_API_KEY, youtube_handle)
-    if not channel_id:
-        return {"error": "No se encontró el canal. Verifica el nombre."}
-    
-    latest_videos = get_latest_non_short_videos(GOOGLE_API_KEY, channel_id, max_results=50)
-    
-    if not latest_videos:
-        return {"message": f"No se encontraron videos recientes de más de 120s en {channel_name}."}
-    
-    processed_videos = []
-    for video in latest_videos:
-        video_id = video["videoId"]
-
-        # 🔹 Verificar si el video ya existe en MongoDB antes de usar IA
-        existing_video = await collection.find_one({"video_id": video_id})
-        if existing_video:
-            print(f"⚠️ El video {video_id} ya existe en MongoDB. Saltando IA...")
-            continue  # Saltar predicción y pasar al siguiente video
-
-        # 🔥 Ahora hacemos la predicción solo si el video no estaba en MongoDB
-        description = get_video_description(GOOGLE_API_KEY, video_id)
-        sponsors = detect_sponsors_openai(description) if description else []
-        text_to_embed = f"""
-        Canal: {channel_name}
-        Título: {video["title"]}
-        Patrocinios: {', '.join(sponsors) if sponsors else 'None'}
-        """
-        embedding = generate_openai_embedding(text_to_embed)
-
-        # Guardar en MongoDB ahora que tenemos la predicción
-        await save_to_mongodb(
-            video_id=video_id,
-            channel_name=channel_name,
-            channel_id=channel_id,
-            published_at=video["publishTime"],
-            sponsors=sponsors,
-            title=video["title"],
-            description=description,
-            embedding=embedding,
-            collection=collection
-        )
-
-        processed_videos.append({
-            "video_id": video_id,
-            "title": video["title"],
-            "published_at": video["publishTime"],
-            "sponsors": sponsors
-        })
-    
-    return {"message": "✅ Procesamiento completado", "channel": channel_name, "videos": processed_videos}
+@app.get("/procesar/{youtube_handle}")
+async def process_youtube_channel(youtube_handle: str, incremental: bool = False):
+    """Encola el escaneo de un canal (detección de patrocinadores y guardado en MongoDB) y devuelve el trabajo.
+
+    Con ?incremental=true solo se leen las subidas posteriores a la última sincronización del canal.
+    El avance se consulta en /jobs/{job_id}.
+    """
+    try:
+        job = await get_scan_job_manager().submit(youtube_handle, incremental=incremental)
+    except asyncio.QueueFull:
+        return {"error": "Hay demasiados escaneos en cola. Inténtalo más tarde."}
+    return {"job_id": job["_id"], "status": job["status"], "handle": job["handle"]}
+
+@app.get("/jobs/{job_id}")
+async def scan_job_status(job_id: str):
+    """Devuelve el estado, progreso y resultado de un trabajo de escaneo."""
+    job = await get_scan_job_manager().get(job_id)
+    if job is None:
+        return {"error": "No existe el trabajo."}
+    job["job_id"] = job.pop("_id")
+    return job
+
+@app.post("/watchlist/{youtube_handle}")
+async def add_channel_to_watchlist(youtube_handle: str):
+    """Añade un canal a la lista que se re-sincroniza periódicamente."""
+    await add_to_watchlist(youtube_handle)
+    return {"message": f"✅ {youtube_handle} añadido a la lista de seguimiento."}
+
+@app.post("/index/refresh")
+async def refresh_vector_index_endpoint():
+    """Incorpora al índice vectorial los videos guardados fuera del servidor (p. ej. por pipeline.bulk_ingest)."""
+    channels = await refresh_index()
+    return {"message": "✅ Índice vectorial actualizado.", "channels": sorted(channels)}
+
+@app.get("/cache/embeddings")
+async def embedding_cache_stats():
+    """Devuelve los contadores de aciertos/fallos de la caché de embeddings."""
+    return get_embedding_cache().stats()
+
+@app.get("/cache/sponsors")
+async def sponsor_cache_stats():
+    """Devuelve los contadores de la caché de extracción de patrocinadores."""
+    return get_sponsor_cache().stats()
+
+@app.get("/cache/answers")
+async def answer_cache_stats():
+    """Devuelve los contadores de la caché semántica de respuestas."""
+    return get_answer_cache().stats()
 
 class ChatMessage(BaseModel):
     message: str
 
+def sse_response(chunks):
+    """Envuelve un iterador asíncrono de fragmentos de texto en una respuesta Server-Sent Events."""
+    async def events():
+        async for chunk in chunks:
+            yield f"data: {json.dumps({'delta': chunk}, ensure_ascii=False)}\n\n"
+        yield "data: [DONE]\n\n"
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+async def _single_chunk(text):
+    yield text
+
 @app.post("/chat")
-async def chat_simulation(user_input: ChatMessage):    
+async def chat_simulation(user_input: ChatMessage, stream: bool = False):
+    """Responde una pregunta sobre patrocinios. Con ?stream=true la respuesta se envía por SSE a medida que se genera."""
     user_query = user_input.message
-    similar_videos = await find_similar_videos(user_query)  # 🔍 Buscar videos similares
+
+    # 🧭 Preguntas puramente estructuradas ("qué marcas patrocinaron a X en marzo"): sin embeddings ni LLM
+    plan = await plan_user_query(user_query)
+    structured_answer = await answer_structured_query(user_query, plan)
+    if structured_answer is not None:
+        return sse_response(_single_chunk(structured_answer)) if stream else {"response": structured_answer}
+
+    query_embedding = await generate_openai_embedding(user_query)
+    similar_videos = await find_similar_videos(user_query, query_embedding=query_embedding, plan=plan)  # 🔍 Buscar videos similares
     
     if similar_videos is None:
-        return {"response": "No encontré información relevante para tu consulta. ¿Puedes reformular tu pregunta?"}
-    
-    openai_response = generate_openai_response(user_query, similar_videos)  
+        no_results = "No encontré información relevante para tu consulta. ¿Puedes reformular tu pregunta?"
+        return sse_response(_single_chunk(no_results)) if stream else {"response": no_results}
+
+    if stream:
+        return sse_response(cached_openai_response_stream(user_query, query_embedding, similar_videos))
+
+    openai_response = await cached_openai_response(user_query, query_embedding, similar_videos)
     
     return {"response": openai_response}
 
@@ -103,8 +200,13 @@ async def verify_webhook(request: Request):
 
 @app.post("/webhook")
 async def receive_whatsapp_message(request: Request):
-    """Recibe mensajes de WhatsApp y responde automáticamente con IA"""
+    """Recibe mensajes de WhatsApp y los encola para responder con IA en segundo plano.
+
+    Se responde 200 de inmediato para que Meta no reintente el webhook; los reintentos que lleguen
+    igualmente se descartan por el ID del mensaje.
+    """
     data = await request.json()
+    dispatcher = get_whatsapp_dispatcher()
 
     if "entry" in data:
         for entry in data["entry"]:
@@ -113,47 +215,10 @@ async def receive_whatsapp_message(request: Request):
                     for message in change["value"]["messages"]:
                         sender_id = message["from"]
                         message_text = message.get("text", {}).get("body", "")
-
-                        print(f"📩 Mensaje recibido: {message_text}")
-
-                        # Verificar si la pregunta es relevante con embeddings
-                        is_relevant = is_relevant_question(message_text)
-                        print(f"🔍 Es relevante? {is_relevant}")  # 📌 Depuración
-
-                        if is_relevant:
-                            print("✅ Buscando en la base de datos...")
-                            similar_videos = await find_similar_videos(message_text) or []
-                            response_text = generate_openai_response(message_text, similar_videos)
-                        else:
-                            print("🤖 Usando ChatGPT para responder...")
-                            response_text = ask_chatgpt(message_text)
-
-                        print(f"📤 Enviando respuesta: {response_text}")  # 📌 Depuración Final
-                        send_whatsapp_message(sender_id, response_text)
+                        dispatcher.enqueue(sender_id, message.get("id"), message_text)
 
     return {"status": "ok"}
 
-def send_whatsapp_message(recipient_id, message):
-    """Envía un mensaje a WhatsApp y muestra la respuesta de la API."""
-    url = f"https://graph.facebook.com/v18.0/{WHATSAPP_PHONE_ID}/messages"
-    
-    headers = {
-        "Authorization": f"Bearer {WHATSAPP_TOKEN}",
-        "Content-Type": "application/json"
-    }
-    
-    payload = {
-        "messaging_product": "whatsapp",
-        "to": recipient_id,
-        "text": {"body": message}
-    }
-
-    response = requests.post(url, headers=headers, json=payload)
-    
-    print(f"📤 Enviando mensaje a {recipient_id}: {message}")  # Verificar que el mensaje se genera
-    print(f"🔍 Respuesta de WhatsApp API: {response.status_code} - {response.json()}")  # Verificar la API
-    
-    return response.json()
-
 if __name__ == "__main__":
+    import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,163 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+from network.http_client import http_post
+from artificial_intelligence.answer_cache import cached_openai_response
+from artificial_intelligence.detect_sponsors import ask_chatgpt, generate_openai_embedding, is_relevant_question
+from database.mongodb import answer_structured_query, find_similar_videos, plan_user_query
+
+logger = logging.getLogger(__name__)
+
+# Cargar variables de entorno
+load_dotenv()
+WHATSAPP_TOKEN = os.getenv("WHATSAPP_TOKEN")
+WHATSAPP_PHONE_ID = os.getenv("WHATSAPP_PHONE_ID")
+
+# Configuración de la cola de mensajes (desde .env)
+WHATSAPP_COALESCE_SECONDS = float(os.getenv("WHATSAPP_COALESCE_SECONDS", "1.5"))  # Ventana para agrupar ráfagas
+WHATSAPP_MIN_REPLY_INTERVAL_SECONDS = float(os.getenv("WHATSAPP_MIN_REPLY_INTERVAL_SECONDS", "3"))  # Por remitente
+WHATSAPP_MAX_CONCURRENT_REPLIES = int(os.getenv("WHATSAPP_MAX_CONCURRENT_REPLIES", "16"))
+WHATSAPP_DEDUP_TTL_SECONDS = int(os.getenv("WHATSAPP_DEDUP_TTL_SECONDS", "86400"))
+WHATSAPP_DEDUP_MAX_IDS = int(os.getenv("WHATSAPP_DEDUP_MAX_IDS", "100000"))
+WHATSAPP_SENDER_IDLE_SECONDS = 60  # Tiempo sin mensajes tras el que se libera el worker de un remitente
+
+async def send_whatsapp_message(recipient_id, message):
+    """Envía un mensaje a WhatsApp y muestra la respuesta de la API."""
+    url = f"https://graph.facebook.com/v18.0/{WHATSAPP_PHONE_ID}/messages"
+
+    headers = {
+        "Authorization": f"Bearer {WHATSAPP_TOKEN}",
+        "Content-Type": "application/json"
+    }
+
+    payload = {
+        "messaging_product": "whatsapp",
+        "to": recipient_id,
+        "text": {"body": message}
+    }
+
+    # Sin reintentos tras un timeout de lectura o un 5xx: Meta pudo haber enviado ya el mensaje
+    response = await http_post(url, headers=headers, json=payload, idempotent=False)
+
+    logger.debug("📤 Enviando mensaje a %s: %s", recipient_id, message)
+    logger.debug("🔍 Respuesta de WhatsApp API: %s - %s", response.status_code, response.text)
+
+    return response.json()
+
+async def answer_message(message_text):
+    """Genera la respuesta de IA para un mensaje (o varios mensajes agrupados) de un usuario."""
+
+    # Las preguntas puramente estructuradas se responden solo con metadatos
+    plan = await plan_user_query(message_text)
+    structured_answer = await answer_structured_query(message_text, plan)
+    if structured_answer is not None:
+        return structured_answer
+
+    # Verificar si la pregunta es relevante con embeddings
+    is_relevant = await is_relevant_question(message_text)
+    logger.debug("🔍 Es relevante? %s", is_relevant)
+
+    if is_relevant:
+        logger.debug("✅ Buscando en la base de datos...")
+        query_embedding = await generate_openai_embedding(message_text)
+        similar_videos = await find_similar_videos(message_text, query_embedding=query_embedding, plan=plan) or []
+        return await cached_openai_response(message_text, query_embedding, similar_videos)
+
+    logger.debug("🤖 Usando ChatGPT para responder...")
+    return await ask_chatgpt(message_text)
+
+class WhatsAppDispatcher:
+    """Cola de mensajes entrantes: deduplica por ID, mantiene el orden por remitente, limita la frecuencia
+    de respuestas y agrupa ráfagas de un mismo remitente en un único turno del LLM."""
+
+    def __init__(self, responder=answer_message, sender=send_whatsapp_message):
+        self.responder = responder
+        self.sender = sender
+        self._seen = OrderedDict()  # message_id -> instante de recepción
+        self._queues = {}
+        self._workers = {}
+        self._last_reply = {}
+        self._semaphore = asyncio.Semaphore(WHATSAPP_MAX_CONCURRENT_REPLIES)
+
+    def _is_duplicate(self, message_id):
+        now = time.monotonic()
+        while self._seen and (len(self._seen) > WHATSAPP_DEDUP_MAX_IDS or
+                              now - next(iter(self._seen.values())) > WHATSAPP_DEDUP_TTL_SECONDS):
+            self._seen.popitem(last=False)
+
+        if message_id in self._seen:
+            return True
+        self._seen[message_id] = now
+        return False
+
+    def enqueue(self, sender_id, message_id, text):
+        """Encola un mensaje; devuelve False si es un reintento ya recibido o está vacío."""
+        if not text or (message_id and self._is_duplicate(message_id)):
+            return False
+
+        queue = self._queues.setdefault(sender_id, asyncio.Queue())
+        queue.put_nowait(text)
+        if sender_id not in self._workers:
+            self._workers[sender_id] = asyncio.create_task(self._sender_worker(sender_id, queue))
+        return True
+
+    async def _sender_worker(self, sender_id, queue):
+        """Procesa en orden los mensajes de un remitente hasta que deja de escribir."""
+        while True:
+            try:
+                first = await asyncio.wait_for(queue.get(), timeout=WHATSAPP_SENDER_IDLE_SECONDS)
+            except asyncio.TimeoutError:
+                # Sin await entre la comprobación y la limpieza: ningún mensaje puede colarse en medio
+                if queue.empty():
+                    self._workers.pop(sender_id, None)
+                    self._queues.pop(sender_id, None)
+                    self._last_reply.pop(sender_id, None)
+                    return
+                continue
+
+            # Esperar un poco para agrupar los mensajes que llegan en ráfaga
+            await asyncio.sleep(WHATSAPP_COALESCE_SECONDS)
+            texts = [first]
+            while not queue.empty():
+                texts.append(queue.get_nowait())
+
+            # Limitar la frecuencia de respuestas por remitente
+            wait = self._last_reply.get(sender_id, 0) + WHATSAPP_MIN_REPLY_INTERVAL_SECONDS - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                while not queue.empty():
+                    texts.append(queue.get_nowait())
+
+            message_text = "\n".join(texts)
+            logger.info("📩 Mensaje recibido de %s (%d agrupados)", sender_id, len(texts))
+            logger.debug("📩 Texto recibido: %s", message_text)
+
+            try:
+                async with self._semaphore:
+                    response_text = await self.responder(message_text)
+                logger.debug("📤 Enviando respuesta: %s", response_text)
+                await self.sender(sender_id, response_text)
+            except Exception as e:
+                logger.exception("❌ Error respondiendo a %s: %s", sender_id, e)
+            finally:
+                self._last_reply[sender_id] = time.monotonic()
+
+    async def stop(self):
+        workers = list(self._workers.values())
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        self._workers.clear()
+        self._queues.clear()
+
+_dispatcher = None
+
+def get_whatsapp_dispatcher():
+    """Devuelve el despachador de mensajes compartido."""
+    global _dispatcher
+    if _dispatcher is None:
+        _dispatcher = WhatsAppDispatcher()
+    return _dispatcher
@@ -0,0 +1,42 @@
+"""Presupuesto de cuota de la YouTube Data API, compartible entre procesos."""
+import multiprocessing
+from monitoring.metrics import YOUTUBE_QUOTA_COST
+
+class QuotaExceeded(Exception):
+    """La llamada superaría el presupuesto de cuota configurado."""
+
+class QuotaBudget:
+    """Presupuesto de unidades de cuota; `counter` puede ser un multiprocessing.Value compartido por varios procesos."""
+
+    def __init__(self, limit, counter=None):
+        self.limit = limit
+        self.counter = counter if counter is not None else multiprocessing.Value("q", 0)
+
+    @property
+    def used(self):
+        return self.counter.value
+
+    def remaining(self):
+        return max(0, self.limit - self.counter.value)
+
+    def consume(self, units):
+        """Reserva unidades antes de la llamada; lanza QuotaExceeded si no quedan suficientes."""
+        with self.counter.get_lock():
+            if self.counter.value + units > self.limit:
+                raise QuotaExceeded(f"Cuota de YouTube agotada ({self.counter.value}/{self.limit} unidades)")
+            self.counter.value += units
+
+_budget = None
+
+def set_quota_budget(budget):
+    """Activa (o desactiva con None) el presupuesto que se comprueba antes de cada llamada a YouTube."""
+    global _budget
+    _budget = budget
+
+def get_quota_budget():
+    return _budget
+
+def charge_quota(endpoint):
+    """Descuenta del presupuesto activo (si lo hay) el coste de una llamada al endpoint."""
+    if _budget is not None:
+        _budget.consume(YOUTUBE_QUOTA_COST.get(endpoint, 1))
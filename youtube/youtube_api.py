@@ -1,83 +1,265 @@
-import requests
+import logging
 import os
 from dotenv import load_dotenv
 import isodate
+from network.http_client import http_get
+from youtube.quota import QuotaExceeded, charge_quota
+
+logger = logging.getLogger(__name__)
 
 load_dotenv()
 GOOGLE_API_KEY = os.getenv("GOOGLE_API")
 
-def get_channel_id_and_name(api_key, handle):
+async def youtube_get(endpoint, url):
+    """GET a la YouTube Data API descontando su coste del presupuesto de cuota (si hay uno activo).
+
+    Se cobra antes de cada intento, reintentos incluidos, porque YouTube factura también las peticiones fallidas.
+    """
+    return await http_get(url, before_attempt=lambda: charge_quota(endpoint))
+
+async def get_channel_id_and_name(api_key, handle):
     """Obtener el ID y nombre de un canal a partir de su handle."""
     url = f"https://www.googleapis.com/youtube/v3/channels?part=id,snippet&forHandle={handle}&key={api_key}"
-    response = requests.get(url)
+    response = await youtube_get("channels", url)
 
     if response.status_code == 200:
         data = response.json()
         if "items" in data and len(data["items"]) > 0:
             return data["items"][0]["id"], data["items"][0]["snippet"]["title"]
     
-    print("❌ No se pudo encontrar el canal:", handle)
+    logger.warning("❌ No se pudo encontrar el canal: %s", handle)
     return None, None
 
-def is_probable_short(video_id, api_key):
-    """Determina si un video es un Short basado en su duración."""
-    url = f"https://www.googleapis.com/youtube/v3/videos?key={api_key}&id={video_id}&part=contentDetails"
-    response = requests.get(url)
+MAX_IDS_PER_CHANNELS_CALL = 50  # Límite de IDs por llamada a channels.list (forHandle solo admite uno)
 
-    try:
-        data = response.json()
-        if "items" in data and len(data["items"]) > 0:
-            duration_iso = data["items"][0]["contentDetails"]["duration"]
-            duration_seconds = int(isodate.parse_duration(duration_iso).total_seconds())
+async def get_channels_by_ids(api_key, channel_ids):
+    """Obtener el nombre de varios canales por ID con channels.list en lotes de hasta 50 IDs.
 
-            if duration_seconds < 180:  # Filtrar videos de menos de 180 segundos
-                return True
-    except Exception as e:
-        print(f"❌ Error obteniendo duración del video {video_id}: {e}")
+    Devuelve {channel_id: nombre}; los IDs inexistentes no aparecen.
+    """
+    channels = {}
+    channel_ids = list(dict.fromkeys(channel_ids))
+
+    for start in range(0, len(channel_ids), MAX_IDS_PER_CHANNELS_CALL):
+        batch = channel_ids[start:start + MAX_IDS_PER_CHANNELS_CALL]
+        url = f"https://www.googleapis.com/youtube/v3/channels?part=id,snippet&id={','.join(batch)}&key={api_key}&maxResults={MAX_IDS_PER_CHANNELS_CALL}"
+        response = await youtube_get("channels", url)
+
+        try:
+            for item in response.json().get("items", []):
+                channels[item["id"]] = item["snippet"]["title"]
+        except Exception as e:
+            logger.error("❌ Error obteniendo %d canales: %s", len(batch), e, extra={"channel_ids": batch})
+
+    return channels
+
+MAX_IDS_PER_VIDEOS_CALL = 50  # Límite de IDs por llamada a videos.list
+SHORT_MAX_SECONDS = 180  # Videos de menos de 180 segundos se consideran Shorts
+
+def parse_duration_seconds(duration_iso):
+    """Convierte una duración ISO 8601 (p. ej. PT4M13S) a segundos."""
+    return int(isodate.parse_duration(duration_iso).total_seconds())
 
-    return False
+async def get_videos_details(api_key, video_ids):
+    """Obtener duración y snippet de varios videos usando videos.list en lotes de hasta 50 IDs."""
+    details = {}
+    video_ids = list(dict.fromkeys(video_ids))  # Eliminar duplicados manteniendo el orden
 
-def get_latest_non_short_videos(api_key, channel_id, max_results=10):
-    """Obtener los últimos videos de un canal excluyendo Shorts."""
+    for start in range(0, len(video_ids), MAX_IDS_PER_VIDEOS_CALL):
+        batch = video_ids[start:start + MAX_IDS_PER_VIDEOS_CALL]
+        url = f"https://www.googleapis.com/youtube/v3/videos?key={api_key}&id={','.join(batch)}&part=contentDetails,snippet&maxResults={MAX_IDS_PER_VIDEOS_CALL}"
+        response = await youtube_get("videos", url)
+
+        try:
+            data = response.json()
+            for item in data.get("items", []):
+                duration_iso = item.get("contentDetails", {}).get("duration")
+                snippet = item.get("snippet", {})
+                details[item["id"]] = {
+                    "duration": parse_duration_seconds(duration_iso) if duration_iso else None,
+                    "title": snippet.get("title"),
+                    "description": snippet.get("description"),
+                    "publishedAt": snippet.get("publishedAt")
+                }
+        except Exception as e:
+            logger.error("❌ Error obteniendo detalles de %d videos: %s", len(batch), e, extra={"video_ids": batch})
+
+    return details
+
+def is_short_duration(duration_seconds):
+    """Determina si una duración en segundos corresponde a un probable Short."""
+    return duration_seconds is not None and duration_seconds < SHORT_MAX_SECONDS
+
+async def is_probable_short(video_id, api_key):
+    """Determina si un video es un Short basado en su duración."""
+    details = (await get_videos_details(api_key, [video_id])).get(video_id)
+    return bool(details) and is_short_duration(details["duration"])
+
+async def get_latest_non_short_videos(api_key, channel_id, max_results=10):
+    """Obtener los últimos videos de un canal excluyendo Shorts.
+
+    Las duraciones y descripciones se resuelven con llamadas agrupadas a videos.list,
+    por lo que cada video incluye también su "description".
+    """
     url = f"https://www.googleapis.com/youtube/v3/search?key={api_key}&channelId={channel_id}&part=snippet,id&order=date&type=video&maxResults={max_results * 3}"
-    response = requests.get(url)
+    response = await youtube_get("search", url)
 
     video_list = []
     try:
         data = response.json()
-        if "items" in data:
-            for item in data["items"]:
-                video_id = item["id"].get("videoId")
-                if not video_id:
-                    continue
-
-                if is_probable_short(video_id, api_key):
-                    continue  # Omitir Shorts
-
-                video_info = {
-                    "videoId": video_id,
-                    "title": item["snippet"]["title"],
-                    "publishTime": item["snippet"]["publishedAt"]
-                }
-                video_list.append(video_info)
+        items = [item for item in data.get("items", []) if item["id"].get("videoId")]
+        details = await get_videos_details(api_key, [item["id"]["videoId"] for item in items])
 
-                if len(video_list) >= max_results:
-                    break
+        for item in items:
+            video_id = item["id"]["videoId"]
+            video_details = details.get(video_id, {})
+            if is_short_duration(video_details.get("duration")):
+                continue  # Omitir Shorts
+
+            video_info = {
+                "videoId": video_id,
+                "title": item["snippet"]["title"],
+                "publishTime": item["snippet"]["publishedAt"],
+                "description": video_details.get("description")
+            }
+            video_list.append(video_info)
+
+            if len(video_list) >= max_results:
+                break
+    except QuotaExceeded:
+        raise  # Sin cuota no se puede devolver una lista parcial como si fuera completa
     except Exception as e:
-        print(f"❌ Error obteniendo videos: {e}")
+        logger.error("❌ Error obteniendo videos del canal %s: %s", channel_id, e)
 
     return video_list
 
-def get_video_description(api_key, video_id):
+async def get_video_description(api_key, video_id):
     """Obtener la descripción de un video."""
-    url = f"https://www.googleapis.com/youtube/v3/videos?key={api_key}&id={video_id}&part=snippet"
-    response = requests.get(url)
+    details = (await get_videos_details(api_key, [video_id])).get(video_id)
+    return details["description"] if details else None
+
+MAX_PLAYLIST_PAGE_SIZE = 50  # Límite de playlistItems.list por página
+MAX_PLAYLIST_PAGES = int(os.getenv("MAX_PLAYLIST_PAGES", "20"))  # Tope de páginas en la primera sincronización (sin marca de agua)
 
+async def get_uploads_playlist_id(api_key, channel_id):
+    """Obtener el ID de la playlist de subidas de un canal (UC... -> UU...)."""
+    if channel_id.startswith("UC"):
+        return "UU" + channel_id[2:]
+
+    url = f"https://www.googleapis.com/youtube/v3/channels?part=contentDetails&id={channel_id}&key={api_key}"
+    response = await youtube_get("channels", url)
     try:
-        data = response.json()
-        if "items" in data and len(data["items"]) > 0:
-            return data["items"][0]["snippet"]["description"]
+        items = response.json().get("items", [])
+        if items:
+            return items[0]["contentDetails"]["relatedPlaylists"]["uploads"]
     except Exception as e:
-        print(f"❌ Error obteniendo la descripción del video: {e}")
-
+        logger.error("❌ Error obteniendo la playlist de subidas de %s: %s", channel_id, e)
     return None
+
+def _is_at_watermark(video_id, published_at, watermark):
+    """Indica si un video ya estaba cubierto por la marca de agua del canal."""
+    if not watermark:
+        return False
+    if video_id == watermark.get("video_id"):
+        return True
+    return bool(published_at and watermark.get("published_at") and published_at <= watermark["published_at"])
+
+async def _iter_upload_pages(api_key, playlist_id, watermark, max_pages=None):
+    """Recorre la playlist de subidas página a página hasta la marca de agua, el final o max_pages.
+
+    Cada página es una lista de (video_id, published_at, title) de la más reciente a la más antigua.
+    Lanza ValueError si una página no se puede leer, para no dar por completo un listado parcial.
+    """
+    page_token = None
+    pages = 0
+    while max_pages is None or pages < max_pages:
+        url = (f"https://www.googleapis.com/youtube/v3/playlistItems?key={api_key}&playlistId={playlist_id}"
+               f"&part=snippet,contentDetails&maxResults={MAX_PLAYLIST_PAGE_SIZE}")
+        if page_token:
+            url += f"&pageToken={page_token}"
+        response = await youtube_get("playlistItems", url)
+        pages += 1
+
+        try:
+            data = response.json()
+        except Exception as e:
+            raise ValueError(f"Respuesta inválida de la playlist {playlist_id}: {e}") from e
+
+        page_items = []
+        reached_watermark = False
+        for item in data.get("items", []):
+            video_id = item["contentDetails"]["videoId"]
+            published_at = item["contentDetails"].get("videoPublishedAt") or item["snippet"].get("publishedAt")
+            if _is_at_watermark(video_id, published_at, watermark):
+                reached_watermark = True
+                break
+            page_items.append((video_id, published_at, item["snippet"].get("title")))
+        yield page_items
+
+        page_token = data.get("nextPageToken")
+        if reached_watermark or not page_token:
+            return
+
+async def _take_non_shorts(api_key, items, video_list, max_results):
+    """Añade a video_list los items que no son Shorts hasta llegar a max_results.
+
+    Devuelve el último item consumido (incluidos los Shorts descartados), o None si no se consumió ninguno.
+    """
+    consumed = None
+    for start in range(0, len(items), MAX_IDS_PER_VIDEOS_CALL):
+        batch = items[start:start + MAX_IDS_PER_VIDEOS_CALL]
+        details = await get_videos_details(api_key, [video_id for video_id, _, _ in batch])
+        for video_id, published_at, title in batch:
+            consumed = (video_id, published_at, title)
+            video_details = details.get(video_id, {})
+            if is_short_duration(video_details.get("duration")):
+                continue  # Omitir Shorts
+
+            video_list.append({
+                "videoId": video_id,
+                "title": title,
+                "publishTime": published_at,
+                "description": video_details.get("description")
+            })
+            if len(video_list) >= max_results:
+                return consumed
+    return consumed
+
+async def get_new_uploads(api_key, channel_id, watermark=None, max_results=50):
+    """Obtener los videos subidos después de la marca de agua, excluyendo Shorts.
+
+    Lee la playlist de subidas (1 unidad de cuota por página, frente a 100 de search). Devuelve (videos, newest)
+    donde newest es la nueva marca de agua ({"video_id", "published_at"}) o None si no hay que moverla.
+
+    Sin marca de agua se toman los max_results más recientes (hasta MAX_PLAYLIST_PAGES páginas). Con marca de
+    agua se pagina hasta alcanzarla y, si hay más de max_results subidas nuevas, se devuelven las más antiguas:
+    newest es entonces la última consumida, de modo que la siguiente sincronización continúa con el resto.
+    """
+    playlist_id = await get_uploads_playlist_id(api_key, channel_id)
+    if not playlist_id:
+        return [], None
+
+    video_list = []
+    try:
+        if not watermark:
+            newest = None
+            async for page_items in _iter_upload_pages(api_key, playlist_id, None, MAX_PLAYLIST_PAGES):
+                if page_items and newest is None:
+                    newest = {"video_id": page_items[0][0], "published_at": page_items[0][1]}
+                await _take_non_shorts(api_key, page_items, video_list, max_results)
+                if len(video_list) >= max_results:
+                    break
+            return video_list, newest
+
+        items = []
+        async for page_items in _iter_upload_pages(api_key, playlist_id, watermark):
+            items.extend(page_items)
+    except ValueError as e:
+        logger.error("❌ Error obteniendo la playlist %s: %s", playlist_id, e)
+        return video_list, None  # Listado incompleto: no se mueve la marca de agua
+
+    items.reverse()  # De la más antigua a la más reciente
+    consumed = await _take_non_shorts(api_key, items, video_list, max_results)
+    video_list.reverse()  # Mismo orden que sin marca de agua: de la más reciente a la más antigua
+    newest = {"video_id": consumed[0], "published_at": consumed[1]} if consumed else None
+    return video_list, newest